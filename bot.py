@@ -1,7 +1,16 @@
+from utils import startup
 import discord
 from discord.ext import commands, tasks
 import os
+import json
 import asyncio
+import hashlib
+from utils.ledger import ledger
+from utils.orders import order_store
+from utils.cooldowns import cooldowns
+
+# Hash of the last command tree synced to Discord, the tree is only synced again when it changes
+TREE_HASH_FILE = 'configs/command_tree.hash'
 
 with open('token.txt', 'r') as f:
     TOKEN = f.read().strip()
@@ -12,21 +21,65 @@ intents.members = True
 bot = commands.Bot(command_prefix='/', intents=intents)
 
 async def load_extensions():
-    for filename in os.listdir("./cogs"):
-        if filename.endswith(".py"):
-            await bot.load_extension(f"cogs.{filename[:-3]}")
+    await asyncio.gather(*(
+        bot.load_extension(f"cogs.{filename[:-3]}")
+        for filename in sorted(os.listdir("./cogs"))
+        if filename.endswith(".py")
+    ))
+
+def command_tree_hash():
+    payload = []
+    for command in bot.tree.get_commands():
+        try:
+            payload.append(command.to_dict(bot.tree))
+        except TypeError:
+            payload.append(command.to_dict())
+    payload.sort(key=lambda command: command['name'])
+    data = json.dumps({"application_id": bot.application_id, "commands": payload}, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+async def sync_command_tree():
+    tree_hash = command_tree_hash()
+    try:
+        with open(TREE_HASH_FILE, 'r', encoding='utf-8') as f:
+            synced_hash = f.read().strip()
+    except FileNotFoundError:
+        synced_hash = None
+
+    if tree_hash == synced_hash and not os.environ.get('STORECORD_FORCE_SYNC'):
+        print("Command tree unchanged, skipping sync")
+        return
+    await bot.tree.sync()
+    with open(TREE_HASH_FILE, 'w', encoding='utf-8') as f:
+        f.write(tree_hash)
+    print("Command tree synced")
+
+@bot.event
+async def setup_hook():
+    # Runs once after login, unlike on_ready which fires again on every reconnect
+    startup.mark("login")
+    await sync_command_tree()
+    startup.mark("sync")
 
 @bot.event
 async def on_ready():
-    await bot.tree.sync()
     await bot.change_presence(activity=discord.Activity(type=discord.ActivityType.competing, name="#1 discord store bot"))
-    os.system("cls")
+    if startup.phases[-1][0] == "sync":
+        startup.mark("ready")
+        print(f"Startup: {startup.summary()}")
     print(f'{bot.user} is online')
 
 async def main():
+    startup.mark("import")
     async with bot:
         await load_extensions()
-        await bot.start(TOKEN)
+        startup.mark("cogs")
+        try:
+            await bot.start(TOKEN)
+        finally:
+            await ledger.close()
+            order_store.close()
+            cooldowns.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -1,7 +1,12 @@
 import discord
 from discord import app_commands
 from discord.ext import commands
+from utils.permissions import has_special_permission
+from utils.ledger import ledger
+from utils.scheduler import Scheduler
+from utils.edits import message_edits
 import json
+import os
 import time
 import asyncio
 from datetime import datetime
@@ -12,53 +17,85 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def load_permissions():
-    try:
-        with open('configs/permissions.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception:
-        return {"users": [], "roles": []}
+GIVEAWAY_FILE = 'configs/autogiveaway.json'
 
-def has_special_permission(user_id, role_ids):
-    permissions = load_permissions()
-    user_id_str = str(user_id).strip()
-    role_ids_str = [str(role_id).strip() for role_id in role_ids]
-    user_has_permission = user_id_str in [str(user).strip() for user in permissions['users']]
-    role_has_permission = any(str(role_id).strip() in [str(role).strip() for role in permissions['roles']] for role_id in role_ids_str)
-    return user_has_permission or role_has_permission
+# 參加/退出後延遲幾秒才寫入檔案，期間的變動合併成一次寫入
+SAVE_DELAY = 2
 
 def load_giveaways():
     try:
-        with open('configs/autogiveaway.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
+        with open(GIVEAWAY_FILE, 'r', encoding='utf-8') as f:
+            giveaways = json.load(f)
     except FileNotFoundError:
         return {}
     except Exception:
         return {}
+    # 參加者在記憶體中以 set 保存
+    for giveaway in giveaways.values():
+        giveaway['entries'] = set(giveaway.get('entries', []))
+    return giveaways
 
-def save_giveaways(data):
-    with open('configs/autogiveaway.json', 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2)
+def dump_giveaways(data):
+    return json.dumps(data, indent=2, default=list)
 
-def load_balances():
-    try:
-        with open('configs/balance.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {}
-    except Exception:
-        return {}
+def write_giveaways(text):
+    tmp_path = GIVEAWAY_FILE + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, GIVEAWAY_FILE)
 
-def save_balances(data):
-    with open('configs/balance.json', 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2)
+def save_giveaways(data):
+    write_giveaways(dump_giveaways(data))
 
 class AutoGiveaway(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.giveaways = load_giveaways()
-        self.bot.loop.create_task(self.check_giveaways())
-        self.bot.loop.create_task(self.update_participant_count())
+        self.scheduler = Scheduler("autogiveaway")
+        self.save_lock = asyncio.Lock()
+        self.saves = 0
+
+    async def cog_load(self):
+        asyncio.create_task(self.start_scheduler())
+
+    async def start_scheduler(self):
+        # 頻道快取在 ready 之後才有資料，太早開獎會找不到頻道
+        await self.bot.wait_until_ready()
+        self.scheduler.start()
+        for giveaway_id in list(self.giveaways):
+            self.schedule_giveaway(giveaway_id)
+            self.refresh_entries(giveaway_id)
+
+    async def cog_unload(self):
+        self.scheduler.stop()
+        if self.scheduler.scheduled('save'):
+            save_giveaways(self.giveaways)
+
+    def save_soon(self):
+        # 合併 SAVE_DELAY 秒內的所有變動
+        if not self.scheduler.scheduled('save'):
+            self.scheduler.schedule('save', time.time() + SAVE_DELAY, self.flush)
+
+    async def flush(self):
+        async with self.save_lock:
+            text = dump_giveaways(self.giveaways)
+            await asyncio.to_thread(write_giveaways, text)
+            self.saves += 1
+
+    def schedule_giveaway(self, giveaway_id):
+        # pending 的抽獎在 first_time 發出第一則訊息，其餘在 time 開獎
+        giveaway = self.giveaways[giveaway_id]
+        when = giveaway['first_time'] if giveaway.get('pending', False) else giveaway['time']
+        self.scheduler.schedule((giveaway_id, 'draw'), when, self.run_giveaway, giveaway_id)
+
+    def unschedule_giveaway(self, giveaway_id):
+        self.scheduler.cancel((giveaway_id, 'draw'))
+        message_edits.discard(self.giveaways[giveaway_id]['message'])
+
+    def remove_giveaway(self, giveaway_id):
+        self.unschedule_giveaway(giveaway_id)
+        del self.giveaways[giveaway_id]
+        self.save_soon()
 
     async def update_giveaway_message(self, channel, giveaway_id, mention, winners, prize, entries_count):
         embed = discord.Embed(
@@ -72,135 +109,132 @@ class AutoGiveaway(commands.Cog):
         message = await channel.send(content=mention if mention else "", embed=embed, view=view)
         return message
 
-    async def edit_giveaway_message(self, channel, message_id, mention, winners, prize, entries_count, giveaway_id):
+    async def send_giveaway_message(self, channel, giveaway_id, mention, winners, prize):
+        giveaway = self.giveaways.get(str(giveaway_id))
+        entry_count = len(giveaway['entries']) if giveaway else 0
+        return await self.update_giveaway_message(channel, giveaway_id, mention, winners, prize, entry_count)
+
+    def render_entries(self, giveaway_id, message_id):
+        # 由 message_edits 在實際送出編輯前呼叫，人數沒變就不編輯
+        giveaway = self.giveaways.get(giveaway_id)
+        if not giveaway or giveaway['message'] != message_id:
+            return None
+        entries_count = len(giveaway['entries'])
+        if entries_count == giveaway.get('last_count', -1):
+            return None
+        giveaway['last_count'] = entries_count
+        self.save_soon()
+
         embed = discord.Embed(
             title="Credit Giveaway!",
-            description=f"Good Luck for `{winners} winners` with **{prize} credit**!\nEntries: **{entries_count}**",
+            description=f"Good Luck for `{giveaway['winners']} winners` with **{giveaway['prize']} credit**!\nEntries: **{entries_count}**",
             color=discord.Color.blue(),
             timestamp=datetime.now()
         )
         view = discord.ui.View(timeout=None)
         view.add_item(self.GiveawayButton(giveaway_id))
-        try:
-            message = await channel.fetch_message(message_id)
-            # 檢查權限
-            permissions = channel.permissions_for(channel.guild.me)
-            if not permissions.manage_messages:
-                logger.warning("Bot lacks MANAGE_MESSAGES permission to edit giveaway message.")
-                # 如果無法編輯，發送新訊息並更新 message_id
-                new_message = await channel.send(content=mention if mention else "", embed=embed, view=view)
-                return new_message.id
-            await message.edit(embed=embed, view=view)
-            return message.id
-        except discord.HTTPException as e:
-            logger.error(f"Failed to edit message {message_id}: {e}")
-            # 如果編輯失敗，發送新訊息並更新 message_id
-            new_message = await channel.send(content=mention if mention else "", embed=embed, view=view)
-            return new_message.id
+        return {"embed": embed, "view": view}
 
-    async def send_giveaway_message(self, channel, giveaway_id, mention, winners, prize):
-        giveaways = load_giveaways()
-        giveaway = giveaways.get(str(giveaway_id))
-        entry_count = len(giveaway.get('entries', [])) if giveaway else 0
-        return await self.update_giveaway_message(channel, giveaway_id, mention, winners, prize, entry_count)
+    async def resend_giveaway_message(self, giveaway_id, message_id, error):
+        logger.error(f"Failed to edit message {message_id}: {error}")
+        # 只有訊息被刪除時才重新發送，其他錯誤保留原本的訊息
+        if not isinstance(error, discord.NotFound):
+            return
+        giveaway = self.giveaways.get(giveaway_id)
+        if not giveaway or giveaway['message'] != message_id:
+            return
+        channel = self.bot.get_channel(giveaway['channel'])
+        if not channel:
+            return
+        # 如果編輯失敗，發送新訊息並更新 message_id
+        entries_count = len(giveaway['entries'])
+        new_message = await self.update_giveaway_message(
+            channel, giveaway_id, giveaway['mention'], giveaway['winners'], giveaway['prize'], entries_count
+        )
+        giveaway['message'] = new_message.id
+        giveaway['last_count'] = entries_count
+        self.save_soon()
+
+    def refresh_entries(self, giveaway_id):
+        # 參加人數增加或減少時呼叫，同一則訊息的編輯會被合併
+        giveaway = self.giveaways.get(giveaway_id)
+        if not giveaway or giveaway.get('pending', False) or not giveaway.get('message'):
+            return
+        channel = self.bot.get_channel(giveaway['channel'])
+        if not channel:
+            return
+        message_id = giveaway['message']
+        message_edits.submit(
+            channel, message_id,
+            lambda: self.render_entries(giveaway_id, message_id),
+            lambda error: self.resend_giveaway_message(giveaway_id, message_id, error)
+        )
+
+    async def run_giveaway(self, giveaway_id):
+        giveaway = self.giveaways.get(giveaway_id)
+        if not giveaway:
+            return
+        current_time = int(time.time())
+        channel = self.bot.get_channel(giveaway['channel'])
+        if not channel:
+            self.remove_giveaway(giveaway_id)
+            return
 
-    async def update_participant_count(self):
-        while True:
-            current_time = int(time.time())
-            giveaways = load_giveaways()
-            for giveaway_id, giveaway in giveaways.items():
-                if giveaway.get('start_time', 0) > 0 and current_time >= giveaway['start_time']:
-                    if (current_time - giveaway['start_time']) % 3 == 0:  # 每 3 秒檢查一次
-                        channel = self.bot.get_channel(giveaway['channel'])
-                        if channel:
-                            entries_count = len(giveaway.get('entries', []))
-                            last_count = giveaway.get('last_count', -1)
-                            if entries_count != last_count:  # 人數增加或減少時觸發
-                                new_message_id = await self.edit_giveaway_message(
-                                    channel, giveaway['message'], giveaway['mention'],
-                                    giveaway['winners'], giveaway['prize'], entries_count, giveaway_id
-                                )
-                                if new_message_id != giveaway['message']:
-                                    giveaway['message'] = new_message_id
-                                giveaway['last_count'] = entries_count
-                                giveaways[giveaway_id] = giveaway
-                                save_giveaways(giveaways)
-            await asyncio.sleep(1)  # 每秒檢查一次，配合 % 3 實現每 3 秒更新
-
-    async def check_giveaways(self):
-        while True:
-            current_time = int(time.time())
-            giveaways = load_giveaways()
-            for giveaway_id, giveaway in list(giveaways.items()):
-                # 檢查是否需要發送第一次抽獎（nexttime 模式）
-                if giveaway.get('pending', False) and current_time >= giveaway['first_time']:
-                    channel = self.bot.get_channel(giveaway['channel'])
-                    if not channel:
-                        del giveaways[giveaway_id]
-                        save_giveaways(giveaways)
-                        continue
-
-                    # 發送第一次抽獎，參加人數立即歸 0
-                    message = await self.update_giveaway_message(
-                        channel, giveaway_id, giveaway['mention'], giveaway['winners'], giveaway['prize'], 0
-                    )
-                    giveaway['message'] = message.id
-                    giveaway['time'] = current_time + (giveaway['first_time'] - giveaway['start_time'])
-                    giveaway['pending'] = False
-                    giveaway['last_count'] = 0  # 立即重置參加人數
-                    giveaway['start_time'] = current_time  # 重新計算 3 秒計時
-                    giveaways[giveaway_id] = giveaway
-                    save_giveaways(giveaways)
-                    continue
-
-                # 檢查是否到達抽獎結束時間
-                if current_time >= giveaway['time']:
-                    channel = self.bot.get_channel(giveaway['channel'])
-                    if not channel:
-                        del giveaways[giveaway_id]
-                        save_giveaways(giveaways)
-                        continue
-
-                    try:
-                        old_message = await channel.fetch_message(giveaway['message'])
-                        await old_message.delete()
-                    except discord.HTTPException:
-                        pass  # 忽略刪除失敗的情況
-
-                    entries = giveaway.get('entries', [])
-                    winners_count = min(giveaway['winners'], len(entries))
-                    if winners_count == 0:
-                        await channel.send("Giveaway Ended `No participants in the giveaway`")
-                    else:
-                        winners = random.sample(entries, winners_count)
-                        prize = giveaway['prize']
-
-                        # 更新中獎者積分
-                        balances = load_balances()
-                        for winner_id in winners:
-                            winner_id_str = str(winner_id)
-                            balances[winner_id_str] = balances.get(winner_id_str, 0) + prize
-                        save_balances(balances)
-
-                        # 發送中獎訊息
-                        winner_mentions = ', '.join(f"<@{winner_id}>" for winner_id in winners)
-                        await channel.send(f"Congratulations {winner_mentions}! You won the **{prize} credit**!")
-
-                    # 發送新的抽獎，參加人數立即歸 0
-                    new_message = await self.update_giveaway_message(
-                        channel, giveaway_id, giveaway['mention'], giveaway['winners'], giveaway['prize'], 0
-                    )
-
-                    # 更新抽獎資訊
-                    giveaway['message'] = new_message.id
-                    giveaway['time'] = current_time + (giveaway['time'] - giveaway['start_time'])
-                    giveaway['entries'] = []
-                    giveaway['last_count'] = 0  # 立即重置參加人數
-                    giveaway['start_time'] = current_time  # 重新計算 3 秒計時
-                    giveaways[giveaway_id] = giveaway
-                    save_giveaways(giveaways)
-
-            await asyncio.sleep(1)  # 每秒檢查一次
+        # 發送第一次抽獎（nexttime 模式）
+        if giveaway.get('pending', False):
+            # 發送第一次抽獎，參加人數立即歸 0
+            message = await self.update_giveaway_message(
+                channel, giveaway_id, giveaway['mention'], giveaway['winners'], giveaway['prize'], 0
+            )
+            giveaway['message'] = message.id
+            giveaway['time'] = current_time + (giveaway['first_time'] - giveaway['start_time'])
+            giveaway['pending'] = False
+            giveaway['last_count'] = 0  # 立即重置參加人數
+            giveaway['start_time'] = current_time
+            self.save_soon()
+            self.schedule_giveaway(giveaway_id)
+            return
+
+        # 抽獎結束
+        message_edits.discard(giveaway['message'])
+        try:
+            await channel.get_partial_message(giveaway['message']).delete()
+        except discord.HTTPException:
+            pass  # 忽略刪除失敗的情況
+
+        entries = list(giveaway['entries'])
+        winners_count = min(giveaway['winners'], len(entries))
+        if winners_count == 0:
+            await channel.send("Giveaway Ended `No participants in the giveaway`")
+        else:
+            winners = random.sample(entries, winners_count)
+            prize = giveaway['prize']
+
+            # 更新中獎者積分
+            await asyncio.gather(*(
+                ledger.credit(winner_id, prize, "giveaway", ref=giveaway_id)
+                for winner_id in winners
+            ))
+
+            # 發送中獎訊息
+            winner_mentions = ', '.join(f"<@{winner_id}>" for winner_id in winners)
+            await channel.send(f"Congratulations {winner_mentions}! You won the **{prize} credit**!")
+
+        # 發送新的抽獎，參加人數立即歸 0
+        new_message = await self.update_giveaway_message(
+            channel, giveaway_id, giveaway['mention'], giveaway['winners'], giveaway['prize'], 0
+        )
+
+        # 更新抽獎資訊
+        if self.giveaways.get(giveaway_id) is not giveaway:
+            return  # 開獎期間被 /autogr 移除
+        giveaway['message'] = new_message.id
+        giveaway['time'] = current_time + (giveaway['time'] - giveaway['start_time'])
+        giveaway['entries'] = set()
+        giveaway['last_count'] = 0  # 立即重置參加人數
+        giveaway['start_time'] = current_time
+        self.save_soon()
+        self.schedule_giveaway(giveaway_id)
 
     class LeaveGiveawayButton(discord.ui.Button):
         def __init__(self, giveaway_id, user_id):
@@ -209,21 +243,20 @@ class AutoGiveaway(commands.Cog):
             self.user_id = user_id
 
         async def callback(self, interaction: discord.Interaction):
-            giveaways = load_giveaways()
-            giveaway = giveaways.get(str(self.giveaway_id))
+            cog = interaction.client.get_cog('AutoGiveaway')
+            giveaway = cog.giveaways.get(str(self.giveaway_id)) if cog else None
             if not giveaway:
                 await interaction.response.send_message("This giveaway has ended or does not exist.", ephemeral=True)
                 return
 
-            entries = giveaway.get('entries', [])
+            entries = giveaway['entries']
             if self.user_id not in entries:
                 await interaction.response.send_message("You are not in this giveaway!", ephemeral=True)
                 return
 
-            entries.remove(self.user_id)
-            giveaway['entries'] = entries
-            giveaways[str(self.giveaway_id)] = giveaway
-            save_giveaways(giveaways)
+            entries.discard(self.user_id)
+            cog.save_soon()
+            cog.refresh_entries(str(self.giveaway_id))
 
             await interaction.response.send_message("You have left the giveaway!", ephemeral=True)
 
@@ -233,19 +266,18 @@ class AutoGiveaway(commands.Cog):
             self.giveaway_id = giveaway_id
 
         async def callback(self, interaction: discord.Interaction):
-            giveaways = load_giveaways()
-            giveaway = giveaways.get(str(self.giveaway_id))
+            cog = interaction.client.get_cog('AutoGiveaway')
+            if not cog:
+                await interaction.response.send_message("Error: Could not load giveaway system.", ephemeral=True)
+                return
+            giveaway = cog.giveaways.get(str(self.giveaway_id))
             if not giveaway:
                 await interaction.response.send_message("This giveaway has ended or does not exist.", ephemeral=True)
                 return
 
             user_id = interaction.user.id
-            entries = giveaway.get('entries', [])
+            entries = giveaway['entries']
             if user_id in entries:
-                cog = interaction.client.get_cog('AutoGiveaway')
-                if not cog:
-                    await interaction.response.send_message("Error: Could not load giveaway system.", ephemeral=True)
-                    return
                 view = discord.ui.View(timeout=60)
                 view.add_item(cog.LeaveGiveawayButton(self.giveaway_id, user_id))
                 await interaction.response.send_message(
@@ -255,10 +287,9 @@ class AutoGiveaway(commands.Cog):
                 )
                 return
 
-            entries.append(user_id)
-            giveaway['entries'] = entries
-            giveaways[str(self.giveaway_id)] = giveaway
-            save_giveaways(giveaways)
+            entries.add(user_id)
+            cog.save_soon()
+            cog.refresh_entries(str(self.giveaway_id))
 
             await interaction.response.send_message("You have successfully entered the giveaway!", ephemeral=True)
 
@@ -309,7 +340,6 @@ class AutoGiveaway(commands.Cog):
         end_time = first_time + duration
 
         # 保存抽獎資訊
-        giveaways = load_giveaways()
         giveaway_id = str(int(time.time() * 1000))  # 使用時間戳作為唯一 ID
         giveaway_data = {
             "channel": interaction.channel.id,
@@ -320,7 +350,7 @@ class AutoGiveaway(commands.Cog):
             "mention": mention_value,
             "winners": winners,
             "prize": prize,
-            "entries": [],
+            "entries": set(),
             "pending": timing == "nexttime",
             "last_count": 0  # 初始參加人數
         }
@@ -333,8 +363,9 @@ class AutoGiveaway(commands.Cog):
             giveaway_data['message'] = message.id
             giveaway_data['pending'] = False
 
-        giveaways[giveaway_id] = giveaway_data
-        save_giveaways(giveaways)
+        self.giveaways[giveaway_id] = giveaway_data
+        self.save_soon()
+        self.schedule_giveaway(giveaway_id)
 
         await interaction.response.send_message("Giveaway has been set up!", ephemeral=True)
 
@@ -354,9 +385,8 @@ class AutoGiveaway(commands.Cog):
             await interaction.response.send_message("Message ID must be a valid integer!", ephemeral=True)
             return
 
-        giveaways = load_giveaways()
         giveaway_id_to_remove = None
-        for giveaway_id, giveaway in giveaways.items():
+        for giveaway_id, giveaway in self.giveaways.items():
             if giveaway['message'] == message_id_int:
                 giveaway_id_to_remove = giveaway_id
                 break
@@ -365,8 +395,7 @@ class AutoGiveaway(commands.Cog):
             await interaction.response.send_message("No giveaway found with that message ID!", ephemeral=True)
             return
 
-        del giveaways[giveaway_id_to_remove]
-        save_giveaways(giveaways)
+        self.remove_giveaway(giveaway_id_to_remove)
         await interaction.response.send_message(f"Giveaway with message ID {message_id} has been removed!", ephemeral=True)
 
 async def setup(bot):
@@ -1,41 +1,16 @@
 import discord
 from discord import app_commands
 from discord.ext import commands
-import json
+from utils.permissions import has_special_permission
+from utils.ledger import ledger
+from utils.bulkcredits import MAX_BULK_BYTES, parse_credit_csv, format_bulk_result
+import asyncio
+import csv
+import io
 import random
+import time
 from datetime import datetime
 
-def load_permissions():
-    try:
-        with open('configs/permissions.json', 'r') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"load permissions.json fail: {e}")
-        return {"users": [], "roles": []}
-
-def load_balances():
-    try:
-        with open('configs/balance.json', 'r') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"load balance.json fail: {e}")
-        return {}
-
-def save_balances(balances):
-    try:
-        with open('configs/balance.json', 'w') as f:
-            json.dump(balances, f, indent=4)
-    except Exception as e:
-        print(f"Error saving balance.json: {e}")
-
-def has_special_permission(user_id, role_ids):
-    permissions = load_permissions()
-    user_id_str = str(user_id).strip()
-    role_ids_str = [str(role_id).strip() for role_id in role_ids]
-    user_has_permission = user_id_str in [str(user).strip() for user in permissions['users']]
-    role_has_permission = any(str(role_id).strip() in [str(role).strip() for role in permissions['roles']] for role_id in role_ids_str)
-    return user_has_permission or role_has_permission
-
 class Balance(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
@@ -51,9 +26,7 @@ class Balance(commands.Cog):
                 await interaction.response.send_message("You do not have permission to query other users' credits!", ephemeral=True)
                 return
 
-        balances = load_balances()
-        user_id_str = str(member.id)
-        credits = balances.get(user_id_str, 0)
+        credits = ledger.get(member.id)
 
         random_color = discord.Color(random.randint(0, 0xFFFFFF))
         embed = discord.Embed(
@@ -87,16 +60,13 @@ class Balance(commands.Cog):
             await interaction.response.send_message("Amount must be a positive number!", ephemeral=True)
             return
 
-        balances = load_balances()
-        user_id_str = str(member.id)
-        current_credits = balances.get(user_id_str, 0)
-
         if action == "add":
-            balances[user_id_str] = current_credits + amount
-            save_balances(balances)
-            await interaction.response.send_message(f"Added {amount} credits to {member.mention}. New balance: {balances[user_id_str]}")
+            new_balance = await ledger.credit(member.id, amount, "modify_add", ref=str(interaction.user.id))
+            await interaction.response.send_message(f"Added {amount} credits to {member.mention}. New balance: {new_balance}")
         else:
-            if amount > current_credits:
+            new_balance = await ledger.debit_if_sufficient(member.id, amount, "modify_remove", ref=str(interaction.user.id))
+            if new_balance is None:
+                current_credits = ledger.get(member.id)
                 view = ConfirmView(interaction, member, current_credits)
                 await interaction.response.send_message(
                     f"{member.mention} only has {current_credits} credits, but you want to remove {amount}. "
@@ -105,9 +75,58 @@ class Balance(commands.Cog):
                     ephemeral=True
                 )
             else:
-                balances[user_id_str] = current_credits - amount
-                save_balances(balances)
-                await interaction.response.send_message(f"Removed {amount} credits from {member.mention}. New balance: {balances[user_id_str]}")
+                await interaction.response.send_message(f"Removed {amount} credits from {member.mention}. New balance: {new_balance}")
+
+    @balance_group.command(name="bulk", description="Add or remove credits for many users from a CSV file")
+    @app_commands.describe(attachment="CSV file with user_id,delta,note rows")
+    async def balance_bulk(self, interaction: discord.Interaction, attachment: discord.Attachment):
+        if not has_special_permission(interaction.user.id, [role.id for role in interaction.user.roles]):
+            await interaction.response.send_message("You do not have permission to use this command!", ephemeral=True)
+            return
+
+        if not attachment.filename.lower().endswith('.csv'):
+            await interaction.response.send_message("Please upload a .csv file!", ephemeral=True)
+            return
+
+        if attachment.size > MAX_BULK_BYTES:
+            await interaction.response.send_message(f"The file is too large, the limit is {MAX_BULK_BYTES >> 20} MB!", ephemeral=True)
+            return
+
+        await interaction.response.defer(ephemeral=True, thinking=True)
+
+        started = time.perf_counter()
+        try:
+            data = await attachment.read()
+            rows, rejected = await asyncio.to_thread(parse_credit_csv, data)
+        except (UnicodeDecodeError, csv.Error) as e:
+            await interaction.followup.send(f"Failed to read the uploaded file, nothing was changed: {e}", ephemeral=True)
+            return
+
+        # 全部驗證完才一次寫入 ledger
+        try:
+            balances, skipped = await ledger.apply_bulk(
+                [(user_id, delta, note) for _, user_id, delta, note in rows], "bulk", ref=str(interaction.user.id)
+            )
+        except Exception as e:
+            await interaction.followup.send(f"Failed to apply the credit changes, nothing was changed: {e}", ephemeral=True)
+            return
+        content = await asyncio.to_thread(format_bulk_result, rows, rejected, balances, skipped)
+        seconds = time.perf_counter() - started
+
+        applied = len(rows) - len(skipped)
+        embed = discord.Embed(
+            title="Bulk Credits",
+            description=(
+                f"Applied {applied} rows for {len(balances)} users in {seconds:.2f}s\n"
+                f"Rejected {len(rejected) + len(skipped)} rows, see the result file for details"
+            ),
+            color=discord.Color.green() if applied else discord.Color.red(),
+            timestamp=datetime.now()
+        )
+        embed.set_footer(text=f"Requested by {interaction.user.display_name}")
+        await interaction.followup.send(
+            embed=embed, file=discord.File(io.BytesIO(content), filename="bulk_result.csv"), ephemeral=True
+        )
 
 class ConfirmView(discord.ui.View):
     def __init__(self, interaction: discord.Interaction, member: discord.Member, current_credits: int):
@@ -118,10 +137,7 @@ class ConfirmView(discord.ui.View):
 
     @discord.ui.button(label="Yes", style=discord.ButtonStyle.green)
     async def confirm(self, interaction: discord.Interaction, button: discord.ui.Button):
-        balances = load_balances()
-        user_id_str = str(self.member.id)
-        balances[user_id_str] = 0
-        save_balances(balances)
+        await ledger.set(self.member.id, 0, "modify_clear", ref=str(interaction.user.id))
         await interaction.response.send_message(f"All {self.current_credits} credits have been removed from {self.member.mention}. New balance: 0")
         self.stop()
 
@@ -0,0 +1,258 @@
+import discord
+from discord import app_commands
+from discord.ext import commands
+from utils.config import load_configs
+from utils.ledger import ledger
+from utils.stockpool import stock_pools
+from utils.orders import order_store, format_cart_order
+from utils.logdispatch import log_dispatcher
+from utils.delivery import order_delivery
+from utils.cooldowns import cooldowns
+from utils.catalog import price_index, search_products
+from utils.reservations import reservations
+import asyncio
+import random
+import string
+import hashlib
+import time
+
+# Most different products one cart can hold
+MAX_CART_LINES = 10
+
+class Cart(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        # user id -> {product: amount}，只保存在記憶體中
+        self.carts = {}
+
+    async def file_autocomplete(self, interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
+        return [app_commands.Choice(name=file, value=file) for file in search_products(current)]
+
+    cart_group = app_commands.Group(name="cart", description="Buy several products in one order")
+
+    def cart_embed(self, user, cart):
+        embed = discord.Embed(title="Your Cart", color=discord.Color.blue(), timestamp=discord.utils.utcnow())
+        total = 0
+        for product, amount in cart.items():
+            price = price_index.price(product)
+            if price is None:
+                embed.add_field(name=product, value=f"**Amount:** `{amount}`\n**Price:** `N/A`", inline=False)
+                continue
+            total += price * amount
+            embed.add_field(
+                name=product,
+                value=f"**Amount:** `{amount}`\n**Price:** `{price * amount} credits` ({price} credits/unit)",
+                inline=False
+            )
+        embed.description = f"**Total:** `{total} credits`"
+        embed.set_footer(text=f"Queried by {user.display_name}")
+        return embed
+
+    @cart_group.command(name="add", description="Add a product to your cart")
+    @app_commands.describe(file="The product to add", amount="Number of units")
+    @app_commands.autocomplete(file=file_autocomplete)
+    async def add(self, interaction: discord.Interaction, file: str, amount: int):
+        if amount <= 0:
+            await interaction.response.send_message("Purchase quantity must be a positive number!", ephemeral=True)
+            return
+        if price_index.price(file) is None:
+            await interaction.response.send_message(f"Product '{file}' is not for sale!", ephemeral=True)
+            return
+
+        cart = self.carts.setdefault(interaction.user.id, {})
+        if file not in cart and len(cart) >= MAX_CART_LINES:
+            await interaction.response.send_message(f"Your cart can hold at most {MAX_CART_LINES} different products!", ephemeral=True)
+            return
+
+        new_amount = cart.get(file, 0) + amount
+        limit = price_index.limit(file)
+        if limit is not None and new_amount > limit:
+            await interaction.response.send_message(
+                f"The product '{file}' has a purchase limit of {limit} units per transaction!", ephemeral=True
+            )
+            return
+        cart[file] = new_amount
+        await interaction.response.send_message(
+            f"Added {amount} {file} to your cart!", embed=self.cart_embed(interaction.user, cart), ephemeral=True
+        )
+
+    @cart_group.command(name="remove", description="Remove a product from your cart")
+    @app_commands.describe(file="The product to remove")
+    @app_commands.autocomplete(file=file_autocomplete)
+    async def remove(self, interaction: discord.Interaction, file: str):
+        cart = self.carts.get(interaction.user.id, {})
+        if file not in cart:
+            await interaction.response.send_message(f"Product '{file}' is not in your cart!", ephemeral=True)
+            return
+        del cart[file]
+        if not cart:
+            self.carts.pop(interaction.user.id, None)
+        await interaction.response.send_message(f"Removed {file} from your cart!", ephemeral=True)
+
+    @cart_group.command(name="show", description="Show your cart")
+    async def show(self, interaction: discord.Interaction):
+        cart = self.carts.get(interaction.user.id)
+        if not cart:
+            await interaction.response.send_message("Your cart is empty!", ephemeral=True)
+            return
+        await interaction.response.send_message(embed=self.cart_embed(interaction.user, cart), ephemeral=True)
+
+    @cart_group.command(name="clear", description="Remove everything from your cart")
+    async def clear(self, interaction: discord.Interaction):
+        self.carts.pop(interaction.user.id, None)
+        await interaction.response.send_message("Your cart has been cleared!", ephemeral=True)
+
+    @cart_group.command(name="checkout", description="Buy everything in your cart in one order")
+    async def checkout(self, interaction: discord.Interaction):
+        user_id = interaction.user.id
+        cart = self.carts.get(user_id)
+        if not cart:
+            await interaction.response.send_message("Your cart is empty!", ephemeral=True)
+            return
+
+        remaining_time = max([cooldowns.remaining(user_id)] + [cooldowns.remaining(user_id, product) for product in cart])
+        if remaining_time > 0:
+            await interaction.response.send_message(f"Please wait {remaining_time} seconds before purchasing again!", ephemeral=True)
+            return
+
+        # 以目前的價格計算每一項
+        lines = []
+        for product, amount in cart.items():
+            price = price_index.price(product)
+            if price is None:
+                await interaction.response.send_message(f"Product '{product}' is no longer for sale, please remove it from your cart!", ephemeral=True)
+                return
+            limit = price_index.limit(product)
+            if limit is not None and amount > limit:
+                await interaction.response.send_message(
+                    f"The product '{product}' has a purchase limit of {limit} units per transaction!", ephemeral=True
+                )
+                return
+            lines.append((product, amount, price * amount))
+        total_cost = sum(cost for _, _, cost in lines)
+
+        if ledger.get(user_id) < total_cost:
+            await interaction.response.send_message("Your credits are insufficient to purchase your cart!", ephemeral=True)
+            return
+
+        # 先保留每一項的庫存，任何一項不足就全部釋放
+        holds = []
+        for product, amount, _ in lines:
+            hold_id = reservations.hold(product, user_id, amount)
+            if hold_id is None:
+                for held in holds:
+                    reservations.release(held)
+                await interaction.response.send_message(
+                    f"Sorry, there are fewer than {amount} units of {product} available right now!", ephemeral=True
+                )
+                return
+            holds.append(hold_id)
+
+        class ConfirmView(discord.ui.View):
+            def __init__(self):
+                super().__init__(timeout=60)
+                self.value = None
+
+            @discord.ui.button(label="Yes", style=discord.ButtonStyle.green)
+            async def confirm(self, interaction: discord.Interaction, button: discord.ui.Button):
+                self.value = True
+                await interaction.response.edit_message(content="Processing your purchase...", embed=None, view=None)
+                self.stop()
+
+            @discord.ui.button(label="No", style=discord.ButtonStyle.red)
+            async def cancel(self, interaction: discord.Interaction, button: discord.ui.Button):
+                self.value = False
+                await interaction.response.edit_message(content="Purchase canceled.", embed=None, view=None)
+                self.stop()
+
+        try:
+            view = ConfirmView()
+            await interaction.response.send_message(
+                f"Are you sure you want to purchase your cart for a total of {total_cost} credits?",
+                embed=self.cart_embed(interaction.user, cart),
+                view=view,
+                ephemeral=True
+            )
+            await view.wait()
+            if not view.value:
+                return  # 超時或取消已由按鈕處理
+
+            random_str = ''.join(random.choices(string.ascii_letters + string.digits, k=8))
+            order_id = hashlib.md5(f"{user_id}{random_str}".encode()).hexdigest()
+
+            # 整個購物車只扣款一次
+            new_balance = await ledger.debit_if_sufficient(user_id, total_cost, "purchase", ref=order_id)
+            if new_balance is None:
+                await interaction.edit_original_response(content="Your credits are insufficient to complete this purchase!", view=None)
+                return
+
+            # 每個產品只抽一次庫存並寫入訂單，任何一步失敗就把已抽出的放回並退款
+            mode = load_configs().get('stock_draw') or 'random'
+            drawn = []
+            try:
+                for (product, amount, cost), hold_id in zip(lines, holds):
+                    drawn.append((product, amount, cost, await asyncio.to_thread(reservations.commit, hold_id, mode)))
+                order_time = int(time.time())
+                order_content = format_cart_order(order_id, order_time, user_id, drawn)
+                order_store.add_cart(order_id, order_time, user_id, lines, order_content)
+            except Exception as e:
+                for product, _, _, items in drawn:
+                    try:
+                        await asyncio.to_thread(stock_pools.get(product).append, items)
+                    except Exception as append_error:
+                        print(f"Error returning {len(items)} units of {product} for order {order_id}: {append_error}")
+                await ledger.credit(user_id, total_cost, "refund", ref=order_id)
+                if isinstance(e, ValueError):
+                    content = "Sorry, part of your cart sold out before your purchase was completed. Your credits have been refunded."
+                else:
+                    content = f"Error during purchase process, your credits have been refunded: {e}"
+                await interaction.edit_original_response(content=content, view=None)
+                return
+            for product, _, _, _ in drawn:
+                stock_pools.get(product).compact_in_background()
+
+            for product, _, _ in lines:
+                cooldowns.start(user_id, product)
+            self.carts.pop(user_id, None)
+
+            # 購買紀錄交給背景送出
+            configs = load_configs()
+            current_time = int(discord.utils.utcnow().timestamp())
+            summary = ", ".join(f"`{product}` **x{amount}**" for product, amount, _ in lines)
+
+            embed = discord.Embed(
+                description=f"Someone purchased {summary} with *{total_cost} credits* at <t:{current_time}:R>",
+                color=discord.Color.gold(),
+                timestamp=discord.utils.utcnow()
+            )
+            embed.set_footer(text="Purchase Completed")
+            log_dispatcher.post(configs.get('public_logs'), embed)
+
+            embed = discord.Embed(
+                description=(
+                    f"{interaction.user.mention} purchased {summary} with *{total_cost} credits* at <t:{current_time}:T>\n"
+                    f"New balance: {new_balance} | Order ID: ||{order_id}||"
+                ),
+                color=discord.Color.yellow(),
+                timestamp=discord.utils.utcnow()
+            )
+            embed.set_footer(text="Purchase Completed")
+            log_dispatcher.post(configs.get('private_logs'), embed)
+
+            await interaction.edit_original_response(content=f"Purchase completed! Delivering order ||{order_id}||...", view=None)
+            outcome = await order_delivery.deliver(interaction, order_id, order_content.encode('utf-8'), f"{order_id}.txt")
+            if outcome == 'dm':
+                content = "Order file has been sent to your DMs!"
+            elif outcome == 'followup':
+                content = "Could not DM you, the order file has been sent below!"
+            else:
+                content = f"Purchase completed but the order file could not be delivered, use `/order {order_id}` to get it."
+            await interaction.edit_original_response(content=content, view=None)
+        except Exception as e:
+            await interaction.edit_original_response(content=f"Error during purchase process: {e}", view=None)
+        finally:
+            for hold_id in holds:
+                reservations.release(hold_id)
+
+async def setup(bot):
+    await bot.add_cog(Cart(bot))
\ No newline at end of file
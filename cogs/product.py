@@ -1,54 +1,21 @@
 import discord
 from discord import app_commands
 from discord.ext import commands
-import json
+from utils.config import load_prices, save_prices
+from utils.permissions import has_special_permission
+from utils.stock import stock_index
+from utils.stockpool import stock_pools
+from utils.catalog import product_catalog, search_products
 import os
-import aiofiles
-
-def load_permissions():
-    try:
-        with open('configs/permissions.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception as e:
-        return {"users": [], "roles": []}
-
-def load_prices():
-    try:
-        with open('configs/price.json', 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            return data
-    except Exception as e:
-        return {}
-
-def save_prices(prices):
-    try:
-        with open('configs/price.json', 'w', encoding='utf-8') as f:
-            json.dump(prices, f, indent=4, ensure_ascii=False)
-    except Exception as e:
-        pass
-
-def has_special_permission(user_id, role_ids):
-    permissions = load_permissions()
-    user_id_str = str(user_id).strip()
-    role_ids_str = [str(role_id).strip() for role_id in role_ids]
-    user_has_permission = user_id_str in [str(user).strip() for user in permissions['users']]
-    role_has_permission = any(str(role_id).strip() in [str(role).strip() for role in permissions['roles']] for role_id in role_ids_str)
-    return user_has_permission or role_has_permission
+import io
+import asyncio
 
 class Product(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
     async def file_autocomplete(self, interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
-        stock_dir = 'stock'
-        if not os.path.exists(stock_dir):
-            return []
-        txt_files = [f[:-4] for f in os.listdir(stock_dir) if f.endswith('.txt')]
-        return [
-            app_commands.Choice(name=file, value=file)
-            for file in txt_files
-            if current.lower() in file.lower()
-        ][:25]
+        return [app_commands.Choice(name=file, value=file) for file in search_products(current)]
 
     product_group = app_commands.Group(name="product", description="Manage products and advanced modify stock")
 
@@ -87,11 +54,13 @@ class Product(commands.Cog):
         try:
             with open(target_file, 'w', encoding='utf-8') as f:
                 pass
+            stock_index.set(name, 0, 0)
+            product_catalog.add(name)
         except Exception as e:
             await interaction.response.send_message(f"Failed to create file: {e}", ephemeral=True)
             return
 
-        prices = load_prices()
+        prices = dict(load_prices())
         prices[f"{name}.txt"] = {"price": price, "limit": limit}
         save_prices(prices)
 
@@ -141,14 +110,14 @@ class Product(commands.Cog):
             await interaction.response.send_message("Deletion canceled.", ephemeral=True)
             return
 
-        target_file = os.path.join(stock_dir, f"{file}.txt")
         try:
-            os.remove(target_file)
+            stock_pools.remove(file)
+            product_catalog.remove(file)
         except Exception as e:
             await interaction.response.send_message(f"Failed to delete file: {e}", ephemeral=True)
             return
 
-        prices = load_prices()
+        prices = dict(load_prices())
         if f"{file}.txt" in prices:
             del prices[f"{file}.txt"]
             save_prices(prices)
@@ -182,33 +151,28 @@ class Product(commands.Cog):
             await interaction.response.send_message(f"Product '{file}' does not exist! Available products: {', '.join(txt_files)}", ephemeral=True)
             return
 
-        target_file = os.path.join(stock_dir, f"{file}.txt")
+        pool = await asyncio.to_thread(stock_pools.get, file)
 
         if action == "remove":
             try:
-                with open(target_file, 'w', encoding='utf-8') as f:
-                    pass
+                await asyncio.to_thread(pool.clear)
                 await interaction.response.send_message(f"Successfully cleared all contents of product '{file}'!", ephemeral=True)
             except Exception as e:
                 await interaction.response.send_message(f"Failed to clear file contents: {e}", ephemeral=True)
 
         elif action == "download":
             try:
-                if not os.path.exists(target_file):
-                    await interaction.response.send_message(f"File '{file}.txt' does not exist!", ephemeral=True)
-                    return
-
-                file_size = os.path.getsize(target_file)
-                if file_size == 0:
+                content = await asyncio.to_thread(pool.export)
+                if not content:
                     await interaction.response.send_message(f"File '{file}.txt' is empty and cannot be downloaded!", ephemeral=True)
                     return
 
-                discord_file = discord.File(target_file, filename=f"{file}.txt")
+                discord_file = discord.File(io.BytesIO(content), filename=f"{file}.txt")
                 try:
                     await interaction.user.send(file=discord_file)
                     await interaction.response.send_message("File has been sent to your DMs!", ephemeral=True)
                 except discord.Forbidden:
-                    discord_file = discord.File(target_file, filename=f"{file}.txt")
+                    discord_file = discord.File(io.BytesIO(content), filename=f"{file}.txt")
                     await interaction.response.send_message(file=discord_file, ephemeral=True)
             except Exception as e:
                 await interaction.response.send_message(f"Failed to download file: {e}", ephemeral=True)
@@ -224,8 +188,7 @@ class Product(commands.Cog):
 
             try:
                 content = await attachment.read()
-                async with aiofiles.open(target_file, 'wb') as f:
-                    await f.write(content)
+                await asyncio.to_thread(pool.replace, content)
                 await interaction.response.send_message(f"Successfully updated the contents of product '{file}'!", ephemeral=True)
             except Exception as e:
                 await interaction.response.send_message(f"Failed to update file: {e}", ephemeral=True)
@@ -1,21 +1,16 @@
 import discord
 from discord import app_commands
 from discord.ext import commands
-import json
+from utils.config import load_prices
+from utils.stock import stock_index
 import random
 from datetime import datetime
 import os
 
-def load_prices():
-    try:
-        with open('configs/price.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception:
-        return {}
-
 class Stock(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        stock_index.rebuild()
 
     @app_commands.command(name="stock", description="Show the stock of all txt files")
     async def stock(self, interaction: discord.Interaction):
@@ -24,17 +19,15 @@ class Stock(commands.Cog):
             await interaction.response.send_message("Stock directory not found!", ephemeral=True)
             return
 
-        txt_files = [f for f in os.listdir(stock_dir) if f.endswith('.txt')]
-        if not txt_files:
+        products = stock_index.products()
+        if not products:
             await interaction.response.send_message("No txt files found in stock directory!", ephemeral=True)
             return
 
         stock_info = []
         prices = load_prices()
-        for txt_file in txt_files:
-            file_path = os.path.join(stock_dir, txt_file)
-            with open(file_path, 'r', encoding='utf-8') as f:
-                lines = [line.strip() for line in f if line.strip()]
+        for product in products:
+            txt_file = f"{product}.txt"
             # 提取 price 和 limit，並格式化顯示
             price_data = prices.get(txt_file, None)
             if price_data:
@@ -43,7 +36,7 @@ class Stock(commands.Cog):
                 price_display = f"\n**Price:** `{price} credit`\n**Maximum:** `{limit} per time`"
             else:
                 price_display = "Price: N/A, Maximum: N/A"
-            stock_info.append((txt_file[:-4], len(lines), price_display))
+            stock_info.append((product, stock_index.count(product), price_display))
 
         random_color = discord.Color(random.randint(0, 0xFFFFFF))
         embed = discord.Embed(
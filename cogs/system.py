@@ -0,0 +1,128 @@
+import discord
+from discord import app_commands
+from discord.ext import commands
+from utils.config import reload_configs, config_stats
+from utils.permissions import has_special_permission
+from utils.ledger import ledger
+from utils.stock import stock_index
+from utils.stockpool import stock_pools
+from utils.catalog import rebuild_catalogs
+from utils.reservations import reservations
+from utils.edits import message_edits
+from utils.logdispatch import log_dispatcher
+from utils.delivery import order_delivery
+from utils import startup
+import asyncio
+import random
+from datetime import datetime
+
+class System(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+
+    async def cog_load(self):
+        log_dispatcher.start(self.bot)
+
+    async def cog_unload(self):
+        # Extensions are unloaded before the connection closes, so queued logs can still go out
+        await log_dispatcher.close()
+
+    system_group = app_commands.Group(name="system", description="Bot maintenance commands")
+
+    @system_group.command(name="reload", description="Reload all config files from disk")
+    async def reload(self, interaction: discord.Interaction):
+        if not has_special_permission(interaction.user.id, [role.id for role in interaction.user.roles]):
+            await interaction.response.send_message("You do not have permission to use this command!", ephemeral=True)
+            return
+
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        reload_configs()
+        await asyncio.to_thread(stock_pools.invalidate)
+        await asyncio.to_thread(stock_index.rebuild)
+        await asyncio.to_thread(rebuild_catalogs)
+        await interaction.followup.send("Config files will be reloaded on next use and the stock index has been rebuilt!", ephemeral=True)
+
+    @system_group.command(name="stats", description="Show cache and performance counters")
+    async def stats(self, interaction: discord.Interaction):
+        if not has_special_permission(interaction.user.id, [role.id for role in interaction.user.roles]):
+            await interaction.response.send_message("You do not have permission to use this command!", ephemeral=True)
+            return
+
+        random_color = discord.Color(random.randint(0, 0xFFFFFF))
+        embed = discord.Embed(
+            title="System Statistics",
+            color=random_color,
+            timestamp=datetime.now()
+        )
+        for name, stats in config_stats().items():
+            embed.add_field(
+                name=f"__{name}.json__",
+                value=f"**Hits:** `{stats['hits']}`\n**Reloads:** `{stats['reloads']}`",
+                inline=True
+            )
+        ledger_stats = ledger.stats()
+        embed.add_field(
+            name="__Balance ledger__",
+            value=(
+                f"**Commits:** `{ledger_stats['commits']}` (`{ledger_stats['commits_per_sec']:.2f}/s`)\n"
+                f"**Flushes:** `{ledger_stats['flushes']}`\n"
+                f"**Batch size:** `{ledger_stats['avg_batch']:.1f}` avg, `{ledger_stats['max_batch']}` max"
+            ),
+            inline=False
+        )
+        products = stock_index.products()
+        hold_stats = reservations.stats()
+        embed.add_field(
+            name="__Stock index__",
+            value=(
+                f"**Products:** `{len(products)}`\n"
+                f"**Units:** `{sum(stock_index.count(product) for product in products)}`\n"
+                f"**Bytes:** `{sum(stock_index.size(product) for product in products)}`\n"
+                f"**Held:** `{hold_stats['units']}` units in `{hold_stats['holds']}` reservations (`{hold_stats['expired']}` expired)"
+            ),
+            inline=False
+        )
+        log_stats = log_dispatcher.stats()
+        embed.add_field(
+            name="__Log dispatcher__",
+            value=(
+                f"**Queued:** `{log_stats['posted']}` (`{log_stats['dropped']}` dropped, `{log_stats['failed']}` failed)\n"
+                f"**Sent:** `{log_stats['embeds']}` embeds in `{log_stats['messages']}` messages\n"
+                f"**Backlog:** `{log_stats['backlog']}` now, `{log_stats['max_backlog']}` max"
+            ),
+            inline=False
+        )
+        delivery_stats = order_delivery.stats()
+        embed.add_field(
+            name="__Order delivery__",
+            value=(
+                f"**DM:** `{delivery_stats['dm']}` | **Followup:** `{delivery_stats['followup']}` | **Failed:** `{delivery_stats['failed']}`\n"
+                f"**Retries:** `{delivery_stats['retries']}`\n"
+                f"**In flight:** `{delivery_stats['in_flight']}` (`{delivery_stats['waiting']}` waiting)\n"
+                f"**Latency:** `{delivery_stats['avg_latency']:.2f}s` avg, `{delivery_stats['p95_latency']:.2f}s` p95"
+            ),
+            inline=False
+        )
+        edit_stats = message_edits.stats()
+        embed.add_field(
+            name="__Message edits__",
+            value=(
+                f"**Sent:** `{edit_stats['sent']}`\n"
+                f"**Skipped:** `{edit_stats['skipped']}`\n"
+                f"**Failed:** `{edit_stats['failed']}` (`{edit_stats['rate_limited']}` rate limited)\n"
+                f"**Pending:** `{edit_stats['pending']}`"
+            ),
+            inline=False
+        )
+        if startup.phases:
+            embed.add_field(
+                name="__Startup__",
+                value="\n".join(f"**{phase.capitalize()}:** `{seconds:.2f}s`" for phase, seconds in startup.phases) + f"\n**Total:** `{startup.total():.2f}s`",
+                inline=False
+            )
+        embed.set_footer(text=f"Queried by {interaction.user.display_name}")
+
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+async def setup(bot):
+    await bot.add_cog(System(bot))
\ No newline at end of file
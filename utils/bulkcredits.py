@@ -0,0 +1,66 @@
+import csv
+import io
+
+# Largest CSV accepted by /credits bulk
+MAX_BULK_BYTES = 16 << 20
+
+RESULT_COLUMNS = ['line', 'user_id', 'delta', 'note', 'status', 'balance']
+
+def parse_credit_csv(data):
+    """Validate an uploaded ``user_id,delta,note`` CSV.
+
+    Returns ``(rows, rejected)``.  ``rows`` holds ``(line, user_id, delta,
+    note)`` for every valid row and ``rejected`` holds ``(line, row, reason)``
+    for the rest.  A header row is skipped if the first cell is not a number.
+    Meant to run in a worker thread.
+    """
+    rows = []
+    rejected = []
+    text = data.decode('utf-8-sig')
+    for line, row in enumerate(csv.reader(io.StringIO(text)), 1):
+        if not row or not any(cell.strip() for cell in row):
+            continue
+        user_id = row[0].strip()
+        if line == 1 and not user_id.isdigit():
+            continue
+        if len(row) < 2:
+            rejected.append((line, row, "missing delta"))
+            continue
+        if not user_id.isdigit():
+            rejected.append((line, row, "invalid user id"))
+            continue
+        try:
+            delta = int(row[1].strip())
+        except ValueError:
+            rejected.append((line, row, "invalid delta"))
+            continue
+        if delta == 0:
+            rejected.append((line, row, "delta is zero"))
+            continue
+        note = ','.join(row[2:]).strip()
+        rows.append((line, user_id, delta, note))
+    return rows, rejected
+
+def format_bulk_result(rows, rejected, balances, skipped):
+    """Build the result CSV, one line per input row in upload order.
+
+    ``balances`` maps users to their balance after the batch and ``skipped``
+    holds the indexes into ``rows`` the ledger refused.
+    """
+    skipped = set(skipped)
+    results = []
+    for index, (line, user_id, delta, note) in enumerate(rows):
+        if index in skipped:
+            results.append((line, user_id, delta, note, 'rejected: insufficient credits', ''))
+        else:
+            results.append((line, user_id, delta, note, 'applied', balances[user_id]))
+    for line, row, reason in rejected:
+        padded = list(row) + ['', '', '']
+        results.append((line, padded[0], padded[1], ','.join(row[2:]), f"rejected: {reason}", ''))
+    results.sort(key=lambda result: result[0])
+
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator='\n')
+    writer.writerow(RESULT_COLUMNS)
+    writer.writerows(results)
+    return output.getvalue().encode('utf-8')
\ No newline at end of file
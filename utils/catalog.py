@@ -0,0 +1,251 @@
+import bisect
+import threading
+import time
+from utils.stock import stock_index
+from utils.keys import key_store
+from utils.orders import order_store
+from utils.config import get_config_file
+from utils.reservations import reservations
+
+# Discord shows at most 25 autocomplete choices
+MAX_CHOICES = 25
+
+# Discord select menus hold at most 25 options
+PAGE_SIZE = 25
+
+# Key files can be dropped into creditkey/ by hand, so the key type list is reloaded after this many seconds
+KEY_TYPES_MAX_AGE = 30
+
+# How long sales totals used for ranking are cached
+SALES_MAX_AGE = 60
+
+class NameIndex:
+    """A sorted list of names answering prefix and substring queries.
+
+    Names are kept sorted by their lowercased form, so a prefix query is a
+    bisect to the first match plus a slice.  Substring matches are found by
+    scanning the rest and are listed after the prefix matches.
+    """
+
+    def __init__(self, loader, max_age=None):
+        self.loader = loader
+        self.max_age = max_age
+        self.keys = None
+        self.names = []
+        self.loaded_at = 0.0
+        self.lock = threading.Lock()
+
+    def _ensure_loaded(self):
+        if self.keys is None or (self.max_age is not None and time.monotonic() - self.loaded_at > self.max_age):
+            self.rebuild()
+
+    def rebuild(self):
+        pairs = sorted({(name.lower(), name) for name in self.loader()})
+        with self.lock:
+            self.keys = [key for key, _ in pairs]
+            self.names = [name for _, name in pairs]
+            self.loaded_at = time.monotonic()
+
+    def invalidate(self):
+        self.keys = None
+
+    def _find(self, name):
+        key = name.lower()
+        i = bisect.bisect_left(self.keys, key)
+        while i < len(self.keys) and self.keys[i] == key:
+            if self.names[i] == name:
+                return i
+            i += 1
+        return None
+
+    def add(self, name):
+        self._ensure_loaded()
+        with self.lock:
+            if self._find(name) is None:
+                i = bisect.bisect_right(self.keys, name.lower())
+                self.keys.insert(i, name.lower())
+                self.names.insert(i, name)
+
+    def remove(self, name):
+        self._ensure_loaded()
+        with self.lock:
+            i = self._find(name)
+            if i is not None:
+                del self.keys[i]
+                del self.names[i]
+
+    def __contains__(self, name):
+        self._ensure_loaded()
+        return self._find(name) is not None
+
+    def all(self):
+        self._ensure_loaded()
+        return list(self.names)
+
+    def search(self, query, rank=None, limit=MAX_CHOICES):
+        """Names starting with ``query`` first, then names containing it, each group ordered by ``rank``."""
+        self._ensure_loaded()
+        query = query.strip().lower()
+        with self.lock:
+            keys, names = self.keys, self.names
+            start = bisect.bisect_left(keys, query)
+            end = bisect.bisect_left(keys, query + '\U0010ffff')
+            prefix = names[start:end]
+            if query:
+                contains = [names[i] for i in range(start) if query in keys[i]]
+                contains += [names[i] for i in range(end, len(keys)) if query in keys[i]]
+            else:
+                contains = []
+        if rank is not None:
+            prefix.sort(key=rank)
+            contains.sort(key=rank)
+        return (prefix + contains)[:limit]
+
+    def __len__(self):
+        self._ensure_loaded()
+        return len(self.names)
+
+class PriceIndex:
+    """Priced products sorted by unit price, rebuilt only when price.json changes.
+
+    The products a balance can pay ``amount`` units of are a prefix of the
+    index found with one bisect (see ``ProductPager``).  Stock counts are
+    joined in from the stock index at query time, so draws and restocks
+    never make the index stale.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.prices = []
+        self.entries = []
+        self.limits = {}
+        self.unit_prices = {}
+        self.lock = threading.Lock()
+
+    def _refresh(self):
+        config_file = get_config_file('price')
+        prices = config_file.get()
+        if config_file.version == self.version:
+            return
+        with self.lock:
+            if config_file.version == self.version:
+                return
+            entries = []
+            limits = {}
+            for product_file, details in prices.items():
+                product = product_file[:-4] if product_file.endswith('.txt') else product_file
+                limits[product] = details.get('limit')
+                if details.get('price') is not None:
+                    entries.append((details['price'], product, details.get('limit')))
+            entries.sort(key=lambda entry: (entry[0], entry[1].lower()))
+            self.prices = [price for price, _, _ in entries]
+            self.entries = entries
+            self.limits = limits
+            self.unit_prices = {product: price for price, product, _ in entries}
+            self.version = config_file.version
+
+    def __len__(self):
+        self._refresh()
+        return len(self.limits)
+
+    def min_price(self):
+        self._refresh()
+        return self.prices[0] if self.prices else None
+
+    def price(self, product):
+        self._refresh()
+        return self.unit_prices.get(product)
+
+    def limit(self, product):
+        self._refresh()
+        return self.limits.get(product)
+
+    def snapshot(self):
+        """The current ``(prices, entries)`` lists; they are replaced, never modified, on rebuild."""
+        self._refresh()
+        with self.lock:
+            return self.prices, self.entries
+
+price_index = PriceIndex()
+
+class ProductPager:
+    """One buyer's pages of products that are affordable, in stock (net of holds) and match a search.
+
+    Pages are built when they are shown by scanning forward from where the
+    previous page ended, and the start of every page seen so far is kept so
+    going back is free.  The pager works on the price index snapshot taken
+    when it was created.
+    """
+
+    def __init__(self, balance, amount, query=None, page_size=PAGE_SIZE):
+        prices, self.entries = price_index.snapshot()
+        self.end = bisect.bisect_right(prices, balance // amount) if amount > 0 else 0
+        self.amount = amount
+        self.query = (query or '').strip().lower()
+        self.page_size = page_size
+        self.starts = [0]
+        self.page = 0
+
+    def _matches(self, entry):
+        _, product, _ = entry
+        if self.query and self.query not in product.lower():
+            return False
+        return reservations.available(product) >= self.amount
+
+    def current(self):
+        """Return ``([(product, price, total_cost)], has_next)`` for the current page."""
+        items = []
+        i = self.starts[self.page]
+        while i < self.end and len(items) < self.page_size:
+            entry = self.entries[i]
+            i += 1
+            if self._matches(entry):
+                price, product, _ = entry
+                items.append((product, price, price * self.amount))
+        while i < self.end and not self._matches(self.entries[i]):
+            i += 1
+        has_next = i < self.end
+        if has_next and len(self.starts) == self.page + 1:
+            self.starts.append(i)
+        return items, has_next
+
+    def next(self):
+        if self.page + 1 < len(self.starts):
+            self.page += 1
+
+    def previous(self):
+        if self.page > 0:
+            self.page -= 1
+
+_sales = {"units": {}, "loaded_at": None}
+
+def sales_units():
+    """Units sold per product, cached for ``SALES_MAX_AGE`` seconds."""
+    now = time.monotonic()
+    if _sales["loaded_at"] is None or now - _sales["loaded_at"] > SALES_MAX_AGE:
+        try:
+            _sales["units"] = {product: units for product, (units, _, _) in order_store.sales_by_product().items()}
+        except Exception as e:
+            print(f"Failed to load sales totals for ranking: {e}")
+        _sales["loaded_at"] = now
+    return _sales["units"]
+
+product_catalog = NameIndex(stock_index.products)
+key_catalog = NameIndex(key_store.key_types, max_age=KEY_TYPES_MAX_AGE)
+
+def search_products(query, limit=MAX_CHOICES):
+    """Product names matching ``query``, best sellers first and then by stock."""
+    units = sales_units()
+    return product_catalog.search(
+        query, rank=lambda product: (-units.get(product, 0), -stock_index.count(product), product.lower()), limit=limit
+    )
+
+def search_key_types(query, limit=MAX_CHOICES):
+    """Key types matching ``query``, the ones with most keys left first."""
+    counts = key_store.counts()
+    return key_catalog.search(query, rank=lambda key_type: (-counts.get(key_type, 0), key_type.lower()), limit=limit)
+
+def rebuild_catalogs():
+    product_catalog.rebuild()
+    key_catalog.rebuild()
+    _sales["loaded_at"] = None
\ No newline at end of file
@@ -0,0 +1,160 @@
+import json
+import os
+import threading
+import time
+
+CONFIG_DIR = 'configs'
+
+# How long a cached config is trusted before its mtime/size is checked again
+CHECK_INTERVAL = 1.0
+
+def _to_int(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        if not value:
+            return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def _coerce_normal(data):
+    if not isinstance(data, dict):
+        return {}
+    data['cooldown'] = _to_int(data.get('cooldown'))
+    product_cooldown = data.get('product_cooldown')
+    if not isinstance(product_cooldown, dict):
+        product_cooldown = {}
+    data['product_cooldown'] = {
+        str(product): seconds
+        for product, seconds in ((product, _to_int(seconds)) for product, seconds in product_cooldown.items())
+        if seconds is not None
+    }
+    return data
+
+def _coerce_prices(data):
+    if not isinstance(data, dict):
+        return {}
+    for product, details in list(data.items()):
+        if not isinstance(details, dict):
+            del data[product]
+            continue
+        details['price'] = _to_int(details.get('price'))
+        details['limit'] = _to_int(details.get('limit'))
+    return data
+
+def _coerce_permissions(data):
+    if not isinstance(data, dict):
+        data = {}
+    data['users'] = [str(user).strip() for user in data.get('users') or []]
+    data['roles'] = [str(role).strip() for role in data.get('roles') or []]
+    return data
+
+class ConfigFile:
+    """A configs/*.json file kept parsed in memory.
+
+    The file is only re-read when its mtime or size changes, when it is saved
+    through this object, or when ``invalidate()`` is called.  The returned
+    object is shared, callers that want to modify it must copy it first.
+    """
+
+    def __init__(self, filename, default, coerce=None):
+        self.path = os.path.join(CONFIG_DIR, filename)
+        self.default = default
+        self.coerce = coerce
+        self.data = None
+        self.signature = None
+        self.checked_at = 0.0
+        self.version = 0
+        self.hits = 0
+        self.reloads = 0
+        self.lock = threading.Lock()
+
+    def _signature(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _load(self):
+        signature = self._signature()
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"Error loading {self.path}: {e}")
+            data = json.loads(json.dumps(self.default))
+        if self.coerce:
+            data = self.coerce(data)
+        self.data = data
+        self.signature = signature
+        self.checked_at = time.monotonic()
+        self.version += 1
+        self.reloads += 1
+
+    def get(self):
+        with self.lock:
+            if self.data is not None:
+                now = time.monotonic()
+                if now - self.checked_at < CHECK_INTERVAL:
+                    self.hits += 1
+                    return self.data
+                self.checked_at = now
+                if self._signature() == self.signature:
+                    self.hits += 1
+                    return self.data
+            self._load()
+            return self.data
+
+    def save(self, data):
+        with self.lock:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=4, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self.data = self.coerce(data) if self.coerce else data
+            self.signature = self._signature()
+            self.checked_at = time.monotonic()
+            self.version += 1
+
+    def invalidate(self):
+        with self.lock:
+            self.data = None
+            self.signature = None
+
+_files = {
+    'normal': ConfigFile('normal.json', {}, _coerce_normal),
+    'price': ConfigFile('price.json', {}, _coerce_prices),
+    'permissions': ConfigFile('permissions.json', {"users": [], "roles": []}, _coerce_permissions),
+}
+
+def get_config_file(name):
+    return _files[name]
+
+def load_configs():
+    return _files['normal'].get()
+
+def load_prices():
+    return _files['price'].get()
+
+def save_prices(prices):
+    try:
+        _files['price'].save(prices)
+    except Exception as e:
+        print(f"Error saving price.json: {e}")
+
+def load_permissions():
+    return _files['permissions'].get()
+
+def reload_configs():
+    for config_file in _files.values():
+        config_file.invalidate()
+
+def config_stats():
+    return {
+        name: {"hits": config_file.hits, "reloads": config_file.reloads, "version": config_file.version}
+        for name, config_file in _files.items()
+    }
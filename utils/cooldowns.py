@@ -0,0 +1,135 @@
+import asyncio
+import collections
+import json
+import math
+import os
+import threading
+import time
+from utils.config import load_configs
+
+COOLDOWN_PATH = os.path.join('configs', 'cooldowns.json')
+
+# Seconds after a cooldown starts before the snapshot is written
+SNAPSHOT_DELAY = 5
+
+class CooldownTracker:
+    """Active purchase cooldowns, expiring on their own.
+
+    Cooldowns of the same length expire in the order they were started, so
+    each length gets one OrderedDict of ``(user_id, product) -> expires_at``
+    and expired entries are swept from its front.  Only users whose cooldown
+    is still running take memory.  ``product`` is None for the global
+    cooldown.  Active cooldowns are written to ``configs/cooldowns.json``
+    shortly after they change and reloaded on startup.
+    """
+
+    def __init__(self, path=COOLDOWN_PATH):
+        self.path = path
+        self.buckets = None
+        self.lock = threading.Lock()
+        self.save_handle = None
+
+    def _ensure_loaded(self):
+        if self.buckets is not None:
+            return
+        buckets = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            snapshot = {}
+        except Exception as e:
+            print(f"Error loading {self.path}: {e}")
+            snapshot = {}
+        now = time.time()
+        for duration, entries in snapshot.items():
+            bucket = collections.OrderedDict()
+            for user_id, product, expires_at in sorted(entries, key=lambda entry: entry[2]):
+                if expires_at > now:
+                    bucket[(str(user_id), product)] = expires_at
+            if bucket:
+                buckets[int(duration)] = bucket
+        self.buckets = buckets
+
+    def _sweep(self, now):
+        for duration, bucket in list(self.buckets.items()):
+            while bucket:
+                key, expires_at = next(iter(bucket.items()))
+                if expires_at > now:
+                    break
+                bucket.popitem(last=False)
+            if not bucket:
+                del self.buckets[duration]
+
+    def remaining(self, user_id, product=None):
+        """Seconds left on the user's cooldown for ``product`` (or the global one if None)."""
+        now = time.time()
+        key = (str(user_id), product)
+        with self.lock:
+            self._ensure_loaded()
+            self._sweep(now)
+            left = 0
+            for bucket in self.buckets.values():
+                expires_at = bucket.get(key)
+                if expires_at is not None:
+                    left = max(left, expires_at - now)
+        return math.ceil(left)
+
+    def start(self, user_id, product):
+        """Start the global and ``product`` cooldowns configured in normal.json after a purchase."""
+        configs = load_configs()
+        durations = [(None, configs.get('cooldown'))]
+        durations.append((product, configs.get('product_cooldown', {}).get(product)))
+        now = time.time()
+        changed = False
+        with self.lock:
+            self._ensure_loaded()
+            self._sweep(now)
+            for cooldown_product, duration in durations:
+                if not duration or duration <= 0:
+                    continue
+                key = (str(user_id), cooldown_product)
+                for bucket in self.buckets.values():
+                    bucket.pop(key, None)
+                self.buckets.setdefault(duration, collections.OrderedDict())[key] = now + duration
+                changed = True
+        if changed:
+            self._save_soon()
+
+    def _save_soon(self):
+        if self.save_handle is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.save()
+            return
+        self.save_handle = loop.call_later(SNAPSHOT_DELAY, self.save)
+
+    def save(self):
+        if self.save_handle is not None:
+            self.save_handle.cancel()
+            self.save_handle = None
+        with self.lock:
+            self._ensure_loaded()
+            self._sweep(time.time())
+            snapshot = {
+                str(duration): [[user_id, product, round(expires_at, 1)] for (user_id, product), expires_at in bucket.items()]
+                for duration, bucket in self.buckets.items()
+            }
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+
+    def close(self):
+        if self.save_handle is not None:
+            self.save()
+
+    def __len__(self):
+        with self.lock:
+            self._ensure_loaded()
+            self._sweep(time.time())
+            return sum(len(bucket) for bucket in self.buckets.values())
+
+cooldowns = CooldownTracker()
\ No newline at end of file
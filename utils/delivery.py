@@ -0,0 +1,118 @@
+import asyncio
+import collections
+import io
+import time
+import discord
+from utils.orders import order_store
+
+# Most order files being uploaded at the same time
+MAX_CONCURRENT = 4
+
+# DM attempts per order before falling back to an ephemeral followup
+MAX_ATTEMPTS = 4
+
+# First retry delay in seconds, doubled after every retryable failure
+RETRY_BASE = 1.0
+
+# Recent delivery latencies kept for /system stats
+LATENCY_SAMPLES = 1000
+
+def _retryable(error):
+    return error.status == 429 or error.status >= 500
+
+def _retry_after(error, default):
+    try:
+        return float(error.response.headers.get('Retry-After', default))
+    except (AttributeError, TypeError, ValueError):
+        return default
+
+class OrderDelivery:
+    """Uploads order files to buyers with a cap on concurrent uploads.
+
+    Each delivery first tries the buyer's DMs, retrying 429 and 5xx errors
+    with exponential backoff.  When DMs are closed or the retries run out the
+    file is sent as an ephemeral followup on the interaction instead.  The
+    outcome, attempt count and latency (including time spent waiting for a
+    slot) are recorded per order in the order store.
+    """
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT):
+        self.max_concurrent = max_concurrent
+        self.semaphore = None
+        self.waiting = 0
+        self.in_flight = 0
+        self.outcomes = collections.Counter()
+        self.retries = 0
+        self.latencies = collections.deque(maxlen=LATENCY_SAMPLES)
+
+    async def _send_dm(self, user, payload, filename):
+        delay = RETRY_BASE
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            try:
+                await user.send(file=discord.File(io.BytesIO(payload), filename=filename))
+                return attempt, None
+            except discord.HTTPException as e:
+                if not _retryable(e) or attempt == MAX_ATTEMPTS:
+                    return attempt, e
+                self.retries += 1
+                await asyncio.sleep(max(delay, _retry_after(e, delay)) if e.status == 429 else delay)
+                delay *= 2
+
+    async def deliver(self, interaction, order_id, payload, filename, fallback_message="Order file sent below:"):
+        """Deliver ``payload`` and return ``'dm'``, ``'followup'`` or ``'failed'``.
+
+        The interaction must already have been responded to or deferred.
+        """
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrent)
+        started = time.monotonic()
+        acquired = False
+        self.waiting += 1
+        try:
+            async with self.semaphore:
+                self.waiting -= 1
+                acquired = True
+                self.in_flight += 1
+                try:
+                    attempts, error = await self._send_dm(interaction.user, payload, filename)
+                    outcome = 'dm'
+                    if error is not None:
+                        try:
+                            await interaction.followup.send(
+                                content=fallback_message,
+                                file=discord.File(io.BytesIO(payload), filename=filename),
+                                ephemeral=True
+                            )
+                            outcome = 'followup'
+                        except discord.HTTPException as e:
+                            print(f"Failed to deliver order {order_id}: {error} / {e}")
+                            outcome = 'failed'
+                finally:
+                    self.in_flight -= 1
+        finally:
+            if not acquired:
+                self.waiting -= 1
+
+        latency = time.monotonic() - started
+        self.outcomes[outcome] += 1
+        self.latencies.append(latency)
+        try:
+            await asyncio.to_thread(order_store.record_delivery, order_id, outcome, attempts, latency)
+        except Exception as e:
+            print(f"Failed to record delivery of order {order_id}: {e}")
+        return outcome
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        return {
+            "dm": self.outcomes['dm'],
+            "followup": self.outcomes['followup'],
+            "failed": self.outcomes['failed'],
+            "retries": self.retries,
+            "waiting": self.waiting,
+            "in_flight": self.in_flight,
+            "avg_latency": sum(latencies) / len(latencies) if latencies else 0.0,
+            "p95_latency": latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+        }
+
+order_delivery = OrderDelivery()
\ No newline at end of file
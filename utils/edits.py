@@ -0,0 +1,168 @@
+import asyncio
+import collections
+import time
+import discord
+
+# Minimum seconds between two edits of the same message
+EDIT_INTERVAL = 3
+
+# Local view of Discord's message edit limit: BUCKET_LIMIT edits per channel every BUCKET_PERIOD seconds
+BUCKET_LIMIT = 5
+BUCKET_PERIOD = 5
+
+# Forget when a message was last edited once this many are remembered
+LAST_SENT_LIMIT = 4096
+
+# Give up on an edit after this many 429 or 5xx responses in a row
+MAX_EDIT_RETRIES = 5
+
+class RateBucket:
+    """Sliding-window counter for one rate-limit route."""
+
+    def __init__(self, limit=BUCKET_LIMIT, period=BUCKET_PERIOD):
+        self.limit = limit
+        self.period = period
+        self.sent = collections.deque()
+        self.blocked_until = 0.0
+
+    def delay(self, now):
+        """Seconds to wait before the next request on this route may go out."""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        while self.sent and self.sent[0] <= now - self.period:
+            self.sent.popleft()
+        if len(self.sent) < self.limit:
+            return 0.0
+        return self.sent[0] + self.period - now
+
+    def take(self, now):
+        self.sent.append(now)
+
+    def block(self, seconds, now):
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+class EditCoalescer:
+    """Merges repeated edits of the same message into at most one per interval.
+
+    ``submit()`` only records the latest ``render`` callable for a message;
+    a per-message task sends it once the message's interval has passed and
+    the channel's edit bucket has room.  ``render`` is called right before
+    sending so the edit carries the newest state, and may return ``None``
+    when there is nothing to change.  Messages are edited through
+    ``PartialMessage`` handles, so no fetch is needed first.
+
+    A 429 or 5xx response blocks the channel's bucket and the edit is queued
+    again (unless a newer one already is); ``fallback`` is only called for
+    other errors, such as the message having been deleted.
+    """
+
+    def __init__(self, interval=EDIT_INTERVAL, bucket_limit=BUCKET_LIMIT, bucket_period=BUCKET_PERIOD):
+        self.interval = interval
+        self.bucket_limit = bucket_limit
+        self.bucket_period = bucket_period
+        self.pending = {}
+        self.tasks = {}
+        self.last_sent = {}
+        self.buckets = {}
+        self.retries = {}
+        self.sent = 0
+        self.skipped = 0
+        self.failed = 0
+        self.rate_limited = 0
+
+    def _bucket(self, message):
+        # Message edits share the channel's PATCH /channels/{channel_id}/messages/{message_id} bucket
+        route = ('PATCH', message.channel.id)
+        bucket = self.buckets.get(route)
+        if bucket is None:
+            bucket = self.buckets[route] = RateBucket(self.bucket_limit, self.bucket_period)
+        return bucket
+
+    def submit(self, channel, message_id, render, fallback=None):
+        """Queue an edit of ``message_id``; ``fallback(error)`` is awaited if it fails."""
+        if message_id in self.pending:
+            self.skipped += 1
+        self.pending[message_id] = (channel.get_partial_message(message_id), render, fallback)
+        if message_id not in self.tasks:
+            self.tasks[message_id] = asyncio.get_running_loop().create_task(self._drain(message_id))
+
+    def discard(self, message_id):
+        """Drop a queued edit, e.g. because the message is being deleted."""
+        self.retries.pop(message_id, None)
+        if self.pending.pop(message_id, None) is not None:
+            self.skipped += 1
+
+    def _prune(self, now):
+        if len(self.last_sent) > LAST_SENT_LIMIT:
+            self.last_sent = {
+                message_id: sent_at
+                for message_id, sent_at in self.last_sent.items()
+                if sent_at > now - self.interval
+            }
+
+    async def _drain(self, message_id):
+        try:
+            while message_id in self.pending:
+                message, render, fallback = self.pending[message_id]
+                bucket = self._bucket(message)
+                now = time.monotonic()
+                wait = bucket.delay(now)
+                last = self.last_sent.get(message_id)
+                if last is not None:
+                    wait = max(wait, last + self.interval - now)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                    continue
+
+                del self.pending[message_id]
+                kwargs = render()
+                if kwargs is None:
+                    self.skipped += 1
+                    continue
+
+                bucket.take(now)
+                self._prune(now)
+                self.last_sent[message_id] = now
+                try:
+                    await message.edit(**kwargs)
+                    self.sent += 1
+                    self.retries.pop(message_id, None)
+                except discord.HTTPException as e:
+                    self.failed += 1
+                    if e.status == 429 or e.status >= 500:
+                        retry_after = self.interval
+                        if e.status == 429:
+                            self.rate_limited += 1
+                            try:
+                                retry_after = float(e.response.headers.get('Retry-After', self.interval))
+                            except (AttributeError, TypeError, ValueError):
+                                pass
+                        bucket.block(retry_after, time.monotonic())
+                        retries = self.retries.get(message_id, 0) + 1
+                        if retries < MAX_EDIT_RETRIES:
+                            self.retries[message_id] = retries
+                            self.pending.setdefault(message_id, (message, render, fallback))
+                        else:
+                            self.retries.pop(message_id, None)
+                            print(f"Giving up editing message {message_id} after {retries} attempts: {e}")
+                        continue
+                    self.retries.pop(message_id, None)
+                    if fallback is not None:
+                        try:
+                            await fallback(e)
+                        except Exception as fallback_error:
+                            print(f"Edit fallback for message {message_id} failed: {fallback_error}")
+        finally:
+            self.tasks.pop(message_id, None)
+
+    def stats(self):
+        return {
+            "sent": self.sent,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "rate_limited": self.rate_limited,
+            "pending": len(self.pending),
+            "buckets": len(self.buckets),
+        }
+
+message_edits = EditCoalescer()
\ No newline at end of file
@@ -0,0 +1,34 @@
+import os
+import tempfile
+from utils.orders import order_store
+
+ORDER_COLUMNS = ['Order ID', 'Order Time', 'Order By', 'Product name', 'Amount', 'Price']
+
+# Asia/Taipei has been UTC+8 without daylight saving since 1980
+TAIPEI_OFFSET = 8 * 3600
+
+def export_orders_xlsx():
+    """Write all orders to a temporary .xlsx file and return (path, row count).
+
+    Meant to run in a worker thread.  Rows are streamed from the order store
+    into a write-only workbook, so memory use does not grow with the number
+    of orders.  The caller removes the file.
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Sheet1')
+    sheet.append(ORDER_COLUMNS)
+    rows = 0
+    for row in order_store.export_rows(TAIPEI_OFFSET):
+        sheet.append(row)
+        rows += 1
+
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    try:
+        workbook.save(path)
+    except Exception:
+        os.remove(path)
+        raise
+    return path, rows
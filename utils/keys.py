@@ -0,0 +1,272 @@
+import asyncio
+import os
+import secrets
+import string
+import threading
+import time
+
+KEY_DIR = 'creditkey'
+
+# Codes redeemed from <type>.txt but not yet compacted out of it
+USED_SUFFIX = '.used'
+
+# Compact a key file once it has this many redeemed codes and they outnumber live ones
+COMPACT_MIN_USED = 1024
+
+KEY_ALPHABET = (string.ascii_letters + string.digits).encode()
+KEY_LENGTH = 12
+
+# Random bytes >= 248 are dropped so every byte left maps uniformly onto the 62 letter alphabet
+_KEEP = 256 - 256 % len(KEY_ALPHABET)
+_KEY_TABLE = bytes(KEY_ALPHABET[b % len(KEY_ALPHABET)] for b in range(256))
+_KEY_REJECT = bytes(range(_KEEP, 256))
+
+def generate_keys(amount, length=KEY_LENGTH):
+    """Generate ``amount`` random codes from the OS CSPRNG."""
+    needed = amount * length
+    chars = b''
+    while len(chars) < needed:
+        raw = secrets.token_bytes((needed - len(chars)) * 256 // _KEEP + 16)
+        chars += raw.translate(_KEY_TABLE, _KEY_REJECT)
+    text = chars[:needed].decode('ascii')
+    return [text[i:i + length] for i in range(0, needed, length)]
+
+def key_points(key_type, code):
+    """Credits a key is worth, or None if it cannot be determined."""
+    try:
+        if key_type == "custom":
+            return int(code.split('.')[-1])
+        return int(key_type)
+    except ValueError:
+        return None
+
+class KeyStore:
+    """Every outstanding redeem code in one in-memory hash map.
+
+    The map goes from code to key type (the creditkey/<type>.txt it lives
+    in).  It is loaded on first use and a key file is re-read when its mtime
+    or size changes.  Redeeming pops the code from the map and appends it to
+    creditkey/<type>.used, so no key file is rewritten until ``compact()``.
+    """
+
+    def __init__(self, directory=KEY_DIR):
+        self.directory = directory
+        self.codes = None
+        self.types = {}
+        self.signatures = {}
+        self.used_counts = {}
+        self.dir_signature = None
+        self.lock = threading.RLock()
+
+    def _path(self, key_type, suffix='.txt'):
+        return os.path.join(self.directory, f"{key_type}{suffix}")
+
+    def _stat(self, path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _read_codes(self, path):
+        if not os.path.exists(path):
+            return []
+        with open(path, 'r', encoding='utf-8') as f:
+            return [line.strip() for line in f if line.strip()]
+
+    def _load_type(self, key_type):
+        for code in self.types.pop(key_type, ()):
+            if self.codes.get(code) == key_type:
+                del self.codes[code]
+        used = self._read_codes(self._path(key_type, USED_SUFFIX))
+        used_set = set(used)
+        live = set()
+        for code in self._read_codes(self._path(key_type)):
+            if code not in used_set and code not in self.codes:
+                self.codes[code] = key_type
+                live.add(code)
+        self.types[key_type] = live
+        self.used_counts[key_type] = len(used)
+        self.signatures[key_type] = self._stat(self._path(key_type))
+
+    def _refresh(self):
+        if self.codes is None:
+            self.codes = {}
+        os.makedirs(self.directory, exist_ok=True)
+        dir_signature = self._stat(self.directory)
+        if dir_signature != self.dir_signature:
+            present = {f[:-4] for f in os.listdir(self.directory) if f.endswith('.txt')}
+            for key_type in set(self.types) - present:
+                for code in self.types.pop(key_type):
+                    self.codes.pop(code, None)
+                self.signatures.pop(key_type, None)
+            for key_type in present - set(self.types):
+                self._load_type(key_type)
+            self.dir_signature = dir_signature
+        for key_type in list(self.types):
+            if self._stat(self._path(key_type)) != self.signatures.get(key_type):
+                self._load_type(key_type)
+
+    def key_types(self):
+        with self.lock:
+            self._refresh()
+            return sorted(self.types)
+
+    def counts(self):
+        """Return ``{key_type: outstanding codes}`` for every key type."""
+        with self.lock:
+            self._refresh()
+            return {key_type: len(codes) for key_type, codes in self.types.items()}
+
+    def count(self, key_type):
+        with self.lock:
+            self._refresh()
+            return len(self.types.get(key_type, ()))
+
+    def lookup(self, code):
+        """Return ``(key_type, points)`` for an outstanding code, or None."""
+        with self.lock:
+            self._refresh()
+            key_type = self.codes.get(code)
+            if key_type is None:
+                return None
+            return key_type, key_points(key_type, code)
+
+    def contains(self, code):
+        with self.lock:
+            self._refresh()
+            return code in self.codes
+
+    def claim(self, code):
+        """Atomically consume a code, returning its key type or None if it was not outstanding."""
+        with self.lock:
+            self._refresh()
+            key_type = self.codes.pop(code, None)
+            if key_type is None:
+                return None
+            self.types[key_type].discard(code)
+            try:
+                with open(self._path(key_type, USED_SUFFIX), 'a', encoding='utf-8') as f:
+                    f.write(code + '\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+            except Exception:
+                self.codes[code] = key_type
+                self.types[key_type].add(code)
+                raise
+            self.used_counts[key_type] = self.used_counts.get(key_type, 0) + 1
+            return key_type
+
+    def needs_compaction(self, key_type):
+        used = self.used_counts.get(key_type, 0)
+        return used >= COMPACT_MIN_USED and used > len(self.types.get(key_type, ()))
+
+    def compact_in_background(self, key_type):
+        if self.needs_compaction(key_type):
+            asyncio.get_running_loop().run_in_executor(None, self.compact, key_type)
+
+    def add(self, key_type, codes):
+        """Append new codes to a key file in a single write."""
+        with self.lock:
+            self._refresh()
+            path = self._path(key_type)
+            with open(path, 'ab+') as f:
+                # Never glue the first new code onto a last line without a newline
+                f.seek(0, os.SEEK_END)
+                prefix = b''
+                if f.tell() > 0:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b'\n':
+                        prefix = b'\n'
+                f.write(prefix + ''.join(code + '\n' for code in codes).encode('utf-8'))
+            if key_type not in self.types:
+                self.types[key_type] = set()
+                self.used_counts[key_type] = 0
+            live = self.types[key_type]
+            for code in codes:
+                self.codes.setdefault(code, key_type)
+                live.add(code)
+            self.signatures[key_type] = self._stat(path)
+            self.dir_signature = self._stat(self.directory)
+
+    def mint(self, key_type, amount, suffix=''):
+        """Generate ``amount`` new unique codes and append them in one write.
+
+        Codes colliding with an outstanding code or with each other are
+        regenerated.  Returns the codes and the seconds taken.
+        """
+        started = time.perf_counter()
+        with self.lock:
+            self._refresh()
+            minted = set()
+            codes = []
+            while len(codes) < amount:
+                for key in generate_keys(amount - len(codes)):
+                    code = key + suffix
+                    if code in minted or code in self.codes:
+                        continue
+                    minted.add(code)
+                    codes.append(code)
+            self.add(key_type, codes)
+        return codes, time.perf_counter() - started
+
+    def clear(self, key_type):
+        """Remove every code of a key type but keep the (empty) key file."""
+        with self.lock:
+            self._refresh()
+            open(self._path(key_type), 'w').close()
+            used_path = self._path(key_type, USED_SUFFIX)
+            if os.path.exists(used_path):
+                os.remove(used_path)
+            self._load_type(key_type)
+
+    def export(self, key_type):
+        """Return the outstanding codes of a key type in file order."""
+        with self.lock:
+            self._refresh()
+            live = self.types.get(key_type, set())
+            codes = [code for code in self._read_codes(self._path(key_type)) if code in live]
+        return ''.join(code + '\n' for code in codes).encode('utf-8')
+
+    def compact(self, key_type):
+        """Rewrite a key file without redeemed codes and trim its .used file.
+
+        The new file is written without holding the lock so /redeem is never
+        held up by it.  Codes redeemed in the meantime stay in the .used file,
+        and the rewrite is dropped if codes were added to the key file.
+        """
+        with self.lock:
+            self._refresh()
+            path = self._path(key_type)
+            signature = self.signatures.get(key_type)
+            live = set(self.types.get(key_type, ()))
+        codes = [code for code in self._read_codes(path) if code in live]
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(''.join(code + '\n' for code in codes))
+            f.flush()
+            os.fsync(f.fileno())
+
+        with self.lock:
+            self._refresh()
+            if key_type not in self.types or self._stat(path) != signature:
+                os.remove(tmp_path)
+                return
+            current = self.types[key_type]
+            redeemed = [code for code in codes if code not in current]
+            # The key file goes first, a crash before the .used file is trimmed only leaves extra entries in it
+            os.replace(tmp_path, path)
+            used_path = self._path(key_type, USED_SUFFIX)
+            if redeemed:
+                used_tmp_path = f"{used_path}.tmp"
+                with open(used_tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(''.join(code + '\n' for code in redeemed))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(used_tmp_path, used_path)
+            elif os.path.exists(used_path):
+                os.remove(used_path)
+            self.used_counts[key_type] = len(redeemed)
+            self.signatures[key_type] = self._stat(path)
+
+key_store = KeyStore()
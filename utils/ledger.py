@@ -0,0 +1,334 @@
+import asyncio
+import collections
+import contextlib
+import json
+import os
+import shutil
+import time
+
+LEDGER_DIR = 'configs'
+
+# Write a compacted snapshot after this many logged mutations
+SNAPSHOT_EVERY = 1000
+
+# How long the first commit of a batch waits for others to join it
+GROUP_COMMIT_WINDOW = 0.005
+
+# Window over which commits/sec is measured
+RATE_WINDOW = 60
+
+class Ledger:
+    """User balances kept in memory and backed by an append-only log.
+
+    Every mutation is appended to ``balance.log`` as one JSON line and is only
+    applied once the log has been flushed to disk.  Commits that arrive within
+    ``GROUP_COMMIT_WINDOW`` of each other share a single write and fsync.
+    Each user has an asyncio lock so read-check-write sequences such as
+    ``debit_if_sufficient`` cannot interleave.
+
+    Every ``SNAPSHOT_EVERY`` entries the balances are written to
+    ``balance.snapshot.json`` and the log is moved onto the end of
+    ``balance.history.log``, which keeps every entry for auditing.  On
+    startup the snapshot is loaded and the log replayed on top of it.
+    ``balance.json`` is still exported on every snapshot for compatibility.
+    """
+
+    def __init__(self, directory=LEDGER_DIR):
+        self.log_path = os.path.join(directory, 'balance.log')
+        self.snapshot_path = os.path.join(directory, 'balance.snapshot.json')
+        self.legacy_path = os.path.join(directory, 'balance.json')
+        self.history_path = os.path.join(directory, 'balance.history.log')
+        self.directory = directory
+        self.balances = None
+        self.seq = 0
+        self.applied_seq = 0
+        self.pending = 0
+        self.log_file = None
+        self.user_locks = {}
+        self.batch = []
+        self.flush_task = None
+        self.commits = 0
+        self.flushes = 0
+        self.batch_sizes = collections.deque(maxlen=1000)
+        self.commit_times = collections.deque()
+
+    def _load(self):
+        os.makedirs(self.directory, exist_ok=True)
+        balances = {}
+        seq = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+            balances = {user_id: int(balance) for user_id, balance in snapshot['balances'].items()}
+            seq = int(snapshot['seq'])
+        elif os.path.exists(self.legacy_path):
+            try:
+                with open(self.legacy_path, 'r', encoding='utf-8') as f:
+                    balances = {user_id: int(balance) for user_id, balance in json.load(f).items()}
+            except Exception as e:
+                print(f"Error loading balance.json: {e}")
+
+        replayed = 0
+        valid_size = 0
+        if os.path.exists(self.log_path):
+            with open(self.log_path, 'rb') as f:
+                for raw in f:
+                    try:
+                        if not raw.endswith(b'\n'):
+                            raise ValueError
+                        entry = json.loads(raw)
+                    except ValueError:
+                        # A torn write from a crash, everything after it is discarded
+                        print(f"Discarding torn balance.log entry at byte {valid_size}")
+                        break
+                    valid_size += len(raw)
+                    if entry['seq'] <= seq:
+                        continue
+                    balances[entry['user']] = balances.get(entry['user'], 0) + entry['delta']
+                    seq = entry['seq']
+                    replayed += 1
+            with open(self.log_path, 'r+b') as f:
+                f.truncate(valid_size)
+
+        self.balances = balances
+        self.seq = seq
+        self.applied_seq = seq
+        self.pending = replayed
+        self.log_file = open(self.log_path, 'ab')
+        if replayed:
+            print(f"Recovered {replayed} balance.log entries")
+
+    def _ensure_loaded(self):
+        if self.balances is None:
+            self._load()
+
+    def _write(self, entries):
+        data = b''.join(json.dumps(entry, ensure_ascii=False).encode('utf-8') + b'\n' for entry in entries)
+        position = self.log_file.tell()
+        try:
+            self.log_file.write(data)
+            self.log_file.flush()
+            os.fsync(self.log_file.fileno())
+        except Exception:
+            # Never leave a half written batch in front of the next one
+            self.log_file.truncate(position)
+            raise
+
+    @contextlib.asynccontextmanager
+    async def _locked(self, *user_ids):
+        # Locks are reference counted so idle users do not keep one around,
+        # and always taken in sorted order so two transfers cannot deadlock
+        user_ids = sorted(set(user_ids))
+        entries = []
+        for user_id in user_ids:
+            entry = self.user_locks.get(user_id)
+            if entry is None:
+                entry = self.user_locks[user_id] = [asyncio.Lock(), 0]
+            entry[1] += 1
+            entries.append(entry)
+        acquired = []
+        try:
+            for lock, _ in entries:
+                await lock.acquire()
+                acquired.append(lock)
+            yield
+        finally:
+            for lock in acquired:
+                lock.release()
+            for user_id, entry in zip(user_ids, entries):
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self.user_locks[user_id]
+
+    async def _commit(self, changes, reason, ref):
+        """Durably log ``[(user_id, delta), ...]`` as one atomic group.
+
+        A change may carry a third ``note`` item, stored with its entry.
+        """
+        entries = []
+        now = int(time.time())
+        for change in changes:
+            self.seq += 1
+            entry = {
+                "seq": self.seq,
+                "user": change[0],
+                "delta": int(change[1]),
+                "reason": reason,
+                "ref": ref,
+                "ts": now
+            }
+            if len(change) > 2 and change[2]:
+                entry["note"] = change[2]
+            entries.append(entry)
+        future = asyncio.get_running_loop().create_future()
+        self.batch.append((entries, future))
+        if self.flush_task is None:
+            self.flush_task = asyncio.create_task(self._flush_soon())
+        await future
+
+    async def _flush_soon(self):
+        await asyncio.sleep(GROUP_COMMIT_WINDOW)
+        try:
+            await self._flush()
+        finally:
+            self.flush_task = None
+
+    async def _flush(self):
+        while self.batch:
+            batch, self.batch = self.batch, []
+            entries = [entry for group, _ in batch for entry in group]
+            try:
+                await asyncio.to_thread(self._write, entries)
+            except Exception as e:
+                print(f"Error writing balance.log: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for entry in entries:
+                self.balances[entry['user']] = self.balances.get(entry['user'], 0) + entry['delta']
+            self.applied_seq = entries[-1]['seq']
+            now = time.monotonic()
+            self.commits += len(batch)
+            self.flushes += 1
+            self.batch_sizes.append(len(batch))
+            self.commit_times.append((now, len(batch)))
+            self.pending += len(entries)
+            for _, future in batch:
+                if not future.done():
+                    future.set_result(None)
+
+            if self.pending >= SNAPSHOT_EVERY:
+                try:
+                    await asyncio.to_thread(self._snapshot, dict(self.balances), self.applied_seq)
+                except Exception as e:
+                    print(f"Error writing balance snapshot: {e}")
+
+    def get(self, user_id):
+        self._ensure_loaded()
+        return self.balances.get(str(user_id), 0)
+
+    async def credit(self, user_id, amount, reason, ref=None):
+        """Add ``amount`` to a balance and return the new balance."""
+        self._ensure_loaded()
+        user_id = str(user_id)
+        async with self._locked(user_id):
+            await self._commit([(user_id, amount)], reason, ref)
+            return self.balances[user_id]
+
+    async def debit_if_sufficient(self, user_id, amount, reason, ref=None):
+        """Remove ``amount`` if the balance covers it.
+
+        Returns the new balance, or ``None`` if the balance was too low.
+        """
+        self._ensure_loaded()
+        user_id = str(user_id)
+        async with self._locked(user_id):
+            if self.balances.get(user_id, 0) < amount:
+                return None
+            await self._commit([(user_id, -amount)], reason, ref)
+            return self.balances[user_id]
+
+    async def set(self, user_id, balance, reason, ref=None):
+        self._ensure_loaded()
+        user_id = str(user_id)
+        async with self._locked(user_id):
+            delta = int(balance) - self.balances.get(user_id, 0)
+            if delta:
+                await self._commit([(user_id, delta)], reason, ref)
+            return self.balances.get(user_id, 0)
+
+    async def transfer(self, from_user_id, to_user_id, amount, reason, ref=None):
+        """Move ``amount`` between two users in one commit.
+
+        Returns ``(from_balance, to_balance)``, or ``None`` if the sender's
+        balance was too low.
+        """
+        self._ensure_loaded()
+        from_user_id = str(from_user_id)
+        to_user_id = str(to_user_id)
+        if from_user_id == to_user_id:
+            balance = self.get(from_user_id)
+            return (balance, balance) if balance >= amount else None
+        async with self._locked(from_user_id, to_user_id):
+            if self.balances.get(from_user_id, 0) < amount:
+                return None
+            await self._commit([(from_user_id, -amount), (to_user_id, amount)], reason, ref)
+            return (self.balances[from_user_id], self.balances[to_user_id])
+
+    async def apply_bulk(self, changes, reason, ref=None):
+        """Apply ``[(user_id, delta, note), ...]`` as one commit.
+
+        Every affected user is locked for the whole batch.  Changes are checked
+        in order against running balances and any that would take a balance
+        below zero is skipped.  Each note is logged with its entry.  Returns
+        ``(balances, skipped)``: the new balance of every user that changed and
+        the indexes of the skipped changes.
+        """
+        self._ensure_loaded()
+        changes = [(str(user_id), int(delta), note) for user_id, delta, note in changes]
+        async with self._locked(*(user_id for user_id, _, _ in changes)):
+            running = {}
+            accepted = []
+            skipped = []
+            for index, (user_id, delta, note) in enumerate(changes):
+                balance = running.get(user_id, self.balances.get(user_id, 0)) + delta
+                if balance < 0:
+                    skipped.append(index)
+                    continue
+                running[user_id] = balance
+                accepted.append((user_id, delta, note))
+            if accepted:
+                await self._commit(accepted, reason, ref)
+            return {user_id: self.balances[user_id] for user_id in running}, skipped
+
+    def _snapshot(self, balances, seq):
+        tmp_path = f"{self.snapshot_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"seq": seq, "balances": balances}, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        with open(self.log_path, 'rb') as src, open(self.history_path, 'ab') as dst:
+            shutil.copyfileobj(src, dst)
+        self.log_file.truncate(0)
+        self.log_file.seek(0)
+        self.pending = 0
+        self._export(balances, self.legacy_path)
+
+    def _export(self, balances, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(balances, f, indent=4, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def export_legacy(self, path=None):
+        self._ensure_loaded()
+        self._export(dict(self.balances), path or self.legacy_path)
+
+    def stats(self):
+        now = time.monotonic()
+        while self.commit_times and now - self.commit_times[0][0] > RATE_WINDOW:
+            self.commit_times.popleft()
+        recent = sum(count for _, count in self.commit_times)
+        sizes = list(self.batch_sizes)
+        return {
+            "commits": self.commits,
+            "flushes": self.flushes,
+            "commits_per_sec": recent / RATE_WINDOW,
+            "avg_batch": sum(sizes) / len(sizes) if sizes else 0,
+            "max_batch": max(sizes) if sizes else 0
+        }
+
+    async def close(self):
+        if self.balances is None:
+            return
+        if self.flush_task is not None:
+            await self.flush_task
+        await self._flush()
+        self._snapshot(dict(self.balances), self.applied_seq)
+        self.log_file.close()
+        self.balances = None
+
+ledger = Ledger()
@@ -0,0 +1,128 @@
+import asyncio
+import discord
+
+# Log events waiting to be sent; further events are dropped while this many are queued
+QUEUE_LIMIT = 1000
+
+# Discord allows up to 10 embeds in one message
+EMBEDS_PER_MESSAGE = 10
+
+# Longest close() waits for queued logs to go out
+FLUSH_TIMEOUT = 10
+
+class LogDispatcher:
+    """Sends log embeds to channels from a background worker.
+
+    Commands call ``post()`` and return at once.  The worker takes every
+    event that is queued when it wakes up, groups them by channel and sends
+    up to ``EMBEDS_PER_MESSAGE`` embeds per message, so a burst of purchases
+    costs a handful of messages instead of one each.
+    """
+
+    def __init__(self, limit=QUEUE_LIMIT):
+        self.limit = limit
+        self.queue = None
+        self.bot = None
+        self.worker = None
+        self.posted = 0
+        self.dropped = 0
+        self.failed = 0
+        self.messages = 0
+        self.embeds = 0
+        self.max_backlog = 0
+
+    def start(self, bot):
+        self.bot = bot
+        if self.queue is None:
+            self.queue = asyncio.Queue(maxsize=self.limit)
+        if self.worker is None or self.worker.done():
+            self.worker = asyncio.get_running_loop().create_task(self._run())
+
+    def post(self, channel_id, embed):
+        """Queue ``embed`` for the channel ``channel_id``; returns False if it was dropped."""
+        if not channel_id or self.queue is None:
+            return False
+        try:
+            channel_id = int(channel_id)
+        except (TypeError, ValueError):
+            print(f"Invalid log channel ID: {channel_id}")
+            self.dropped += 1
+            return False
+        try:
+            self.queue.put_nowait((channel_id, embed))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        self.posted += 1
+        self.max_backlog = max(self.max_backlog, self.queue.qsize())
+        return True
+
+    def _take_batch(self, first):
+        batch = [first]
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except asyncio.QueueEmpty:
+                return batch
+
+    async def _send(self, batch):
+        by_channel = {}
+        for channel_id, embed in batch:
+            by_channel.setdefault(channel_id, []).append(embed)
+
+        for channel_id, embeds in by_channel.items():
+            channel = self.bot.get_channel(channel_id)
+            if channel is None:
+                print(f"Could not find log channel ID: {channel_id}")
+                self.failed += len(embeds)
+                continue
+            if getattr(channel, 'guild', None) and not channel.permissions_for(channel.guild.me).send_messages:
+                print(f"Missing permission to send to log channel ID: {channel_id}")
+                self.failed += len(embeds)
+                continue
+            for i in range(0, len(embeds), EMBEDS_PER_MESSAGE):
+                chunk = embeds[i:i + EMBEDS_PER_MESSAGE]
+                try:
+                    await channel.send(embeds=chunk)
+                    self.messages += 1
+                    self.embeds += len(chunk)
+                except discord.HTTPException as e:
+                    print(f"Failed to send to log channel {channel_id}: {e}")
+                    self.failed += len(chunk)
+
+    async def _run(self):
+        while True:
+            batch = self._take_batch(await self.queue.get())
+            try:
+                await self._send(batch)
+            except Exception as e:
+                print(f"Log dispatcher error: {e}")
+                self.failed += len(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def close(self):
+        """Send whatever is still queued, then stop the worker."""
+        if self.worker is None:
+            return
+        if not self.worker.done():
+            try:
+                await asyncio.wait_for(self.queue.join(), FLUSH_TIMEOUT)
+            except asyncio.TimeoutError:
+                print(f"Gave up flushing {self.queue.qsize()} log events")
+        self.worker.cancel()
+        self.worker = None
+
+    def stats(self):
+        return {
+            "posted": self.posted,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "messages": self.messages,
+            "embeds": self.embeds,
+            "backlog": self.queue.qsize() if self.queue is not None else 0,
+            "max_backlog": self.max_backlog,
+        }
+
+log_dispatcher = LogDispatcher()
\ No newline at end of file
@@ -0,0 +1,370 @@
+import os
+import sqlite3
+import threading
+import time
+
+ORDER_DIR = 'order'
+
+HOUR = 3600
+DAY = 86400
+
+# Hourly sales buckets are kept this long, enough for the 30 day /productssold window
+HOURLY_RETENTION = 31 * DAY
+
+# Stored in meta once the aggregate tables match the current schema
+AGGREGATES_VERSION = '2'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    order_id TEXT PRIMARY KEY,
+    order_time INTEGER NOT NULL,
+    order_by TEXT NOT NULL,
+    product TEXT NOT NULL,
+    amount INTEGER NOT NULL,
+    price INTEGER NOT NULL,
+    content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS orders_by_buyer ON orders (order_by, order_time);
+CREATE INDEX IF NOT EXISTS orders_by_product ON orders (product, order_time);
+CREATE INDEX IF NOT EXISTS orders_by_time ON orders (order_time);
+CREATE TABLE IF NOT EXISTS sales_totals (
+    product TEXT PRIMARY KEY,
+    units INTEGER NOT NULL,
+    revenue INTEGER NOT NULL,
+    orders INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sales_daily (
+    product TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    units INTEGER NOT NULL,
+    revenue INTEGER NOT NULL,
+    orders INTEGER NOT NULL,
+    PRIMARY KEY (product, day)
+);
+CREATE TABLE IF NOT EXISTS sales_hourly (
+    product TEXT NOT NULL,
+    hour INTEGER NOT NULL,
+    units INTEGER NOT NULL,
+    revenue INTEGER NOT NULL,
+    orders INTEGER NOT NULL,
+    PRIMARY KEY (product, hour)
+);
+CREATE INDEX IF NOT EXISTS sales_hourly_by_hour ON sales_hourly (hour);
+CREATE TABLE IF NOT EXISTS order_items (
+    order_id TEXT NOT NULL,
+    product TEXT NOT NULL,
+    amount INTEGER NOT NULL,
+    price INTEGER NOT NULL,
+    PRIMARY KEY (order_id, product)
+);
+CREATE INDEX IF NOT EXISTS order_items_by_product ON order_items (product);
+CREATE TABLE IF NOT EXISTS deliveries (
+    order_id TEXT NOT NULL,
+    delivered_at INTEGER NOT NULL,
+    outcome TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    latency REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS deliveries_by_order ON deliveries (order_id, delivered_at);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+_COLUMNS = "order_id, order_time, order_by, product, amount, price"
+
+def format_order(order_id, order_time, order_by, product, amount, price, items):
+    """Render an order the way it is delivered to the buyer."""
+    content = (
+        f"Order ID: {order_id}\n"
+        f"Order Time: {order_time}\n"
+        f"Order By: {order_by}\n\n"
+        f"Product name: {product}\n"
+        f"Amount: {amount}\n"
+        f"Price: {price}\n\n"
+    )
+    return content + "\n".join(f"> {item}\n" for item in items)
+
+def format_cart_order(order_id, order_time, order_by, lines):
+    """Render a cart order; ``lines`` are ``(product, amount, price, items)``."""
+    content = (
+        f"Order ID: {order_id}\n"
+        f"Order Time: {order_time}\n"
+        f"Order By: {order_by}\n\n"
+        f"Product name: {cart_summary((product, amount) for product, amount, _, _ in lines)}\n"
+        f"Amount: {sum(amount for _, amount, _, _ in lines)}\n"
+        f"Price: {sum(price for _, _, price, _ in lines)}\n"
+    )
+    for product, amount, price, items in lines:
+        content += f"\n[{product} x{amount} - {price} credits]\n\n"
+        content += "\n".join(f"> {item}\n" for item in items)
+    return content
+
+def cart_summary(lines):
+    """The product column of a cart order, e.g. ``Netflix x2, Spotify x1``."""
+    return ", ".join(f"{product} x{amount}" for product, amount in lines)
+
+def parse_legacy_order(content):
+    """Read the header fields of an order/*.txt file by their line positions."""
+    lines = [line.strip() for line in content.splitlines()]
+    if len(lines) < 7:
+        raise ValueError("incorrect format")
+    values = [line.split(':', 1)[1].strip() if ':' in line else line for line in lines[:7]]
+    return {
+        "order_id": values[0],
+        "order_time": int(values[1]),
+        "order_by": values[2],
+        "product": values[4],
+        "amount": int(values[5]),
+        "price": int(values[6])
+    }
+
+class OrderStore:
+    """All orders in one SQLite database keyed by order id.
+
+    Secondary indexes on buyer, product and time keep /order, /excel and
+    /productssold from having to open every order file; cart lines are
+    indexed by product in ``order_items``.  Orders written by older versions
+    as order/*.txt are imported once, the first time the store is opened.
+
+    Units, revenue and order count per product are kept as running totals,
+    per-day (UTC) buckets and per-hour buckets for the last
+    ``HOURLY_RETENTION`` seconds, updated in the same transaction as the order.
+
+    A cart order is one row whose product column lists every line (see
+    ``cart_summary``); the lines themselves are in ``order_items`` and are
+    what the sales aggregates count.
+    """
+
+    def __init__(self, directory=ORDER_DIR):
+        self.directory = directory
+        self.db_path = os.path.join(directory, 'orders.db')
+        self.conn = None
+        self.lock = threading.RLock()
+
+    def _connect(self):
+        if self.conn is not None:
+            return self.conn
+        with self.lock:
+            if self.conn is None:
+                os.makedirs(self.directory, exist_ok=True)
+                conn = sqlite3.connect(self.db_path, check_same_thread=False)
+                conn.row_factory = sqlite3.Row
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.executescript(_SCHEMA)
+                self.conn = conn
+                if conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_imported'").fetchone() is None:
+                    self.import_legacy()
+                built = conn.execute("SELECT value FROM meta WHERE key = 'aggregates_built'").fetchone()
+                if built is None or built[0] != AGGREGATES_VERSION:
+                    self.rebuild_aggregates()
+        return self.conn
+
+    def import_legacy(self):
+        """Import every order/*.txt file, returning (imported, skipped file names)."""
+        conn = self._connect()
+        imported = 0
+        skipped = []
+        with self.lock:
+            for filename in sorted(os.listdir(self.directory)):
+                if not filename.endswith('.txt'):
+                    continue
+                try:
+                    with open(os.path.join(self.directory, filename), 'r', encoding='utf-8') as f:
+                        content = f.read()
+                    order = parse_legacy_order(content)
+                except Exception as e:
+                    print(f"Error importing order file {filename}: {e}")
+                    skipped.append(filename)
+                    continue
+                cursor = conn.execute(
+                    f"INSERT OR IGNORE INTO orders ({_COLUMNS}, content) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (order['order_id'], order['order_time'], order['order_by'], order['product'],
+                     order['amount'], order['price'], content)
+                )
+                if cursor.rowcount:
+                    self._aggregate(conn, order['product'], order['order_time'], order['amount'], order['price'])
+                    imported += 1
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('legacy_imported', '1')")
+            conn.commit()
+        if imported or skipped:
+            print(f"Imported {imported} legacy order files, skipped {len(skipped)}")
+        return imported, skipped
+
+    def _aggregate(self, conn, product, order_time, amount, price):
+        conn.execute(
+            "INSERT INTO sales_totals (product, units, revenue, orders) VALUES (?, ?, ?, 1) "
+            "ON CONFLICT (product) DO UPDATE SET units = units + excluded.units, "
+            "revenue = revenue + excluded.revenue, orders = orders + 1",
+            (product, amount, price)
+        )
+        conn.execute(
+            "INSERT INTO sales_daily (product, day, units, revenue, orders) VALUES (?, ?, ?, ?, 1) "
+            "ON CONFLICT (product, day) DO UPDATE SET units = units + excluded.units, "
+            "revenue = revenue + excluded.revenue, orders = orders + 1",
+            (product, order_time // DAY, amount, price)
+        )
+        if order_time >= time.time() - HOURLY_RETENTION:
+            conn.execute(
+                "INSERT INTO sales_hourly (product, hour, units, revenue, orders) VALUES (?, ?, ?, ?, 1) "
+                "ON CONFLICT (product, hour) DO UPDATE SET units = units + excluded.units, "
+                "revenue = revenue + excluded.revenue, orders = orders + 1",
+                (product, order_time // HOUR, amount, price)
+            )
+
+    def _prune_hourly(self, conn):
+        conn.execute("DELETE FROM sales_hourly WHERE hour < ?", ((int(time.time()) - HOURLY_RETENTION) // HOUR,))
+
+    def rebuild_aggregates(self):
+        """Recompute the sales totals and the daily and hourly buckets from the orders table."""
+        conn = self._connect()
+        lines = (
+            "SELECT product, order_time, amount, price FROM orders "
+            "WHERE order_id NOT IN (SELECT order_id FROM order_items) "
+            "UNION ALL SELECT i.product, o.order_time, i.amount, i.price "
+            "FROM order_items i JOIN orders o ON o.order_id = i.order_id"
+        )
+        with self.lock:
+            conn.execute("DELETE FROM sales_totals")
+            conn.execute("DELETE FROM sales_daily")
+            conn.execute("DELETE FROM sales_hourly")
+            conn.execute(
+                "INSERT INTO sales_daily (product, day, units, revenue, orders) "
+                f"SELECT product, order_time / {DAY} AS day, SUM(amount), SUM(price), COUNT(*) "
+                f"FROM ({lines}) GROUP BY product, day"
+            )
+            conn.execute(
+                "INSERT INTO sales_hourly (product, hour, units, revenue, orders) "
+                f"SELECT product, order_time / {HOUR} AS hour, SUM(amount), SUM(price), COUNT(*) "
+                f"FROM ({lines}) WHERE order_time >= ? GROUP BY product, hour",
+                (int(time.time()) - HOURLY_RETENTION,)
+            )
+            conn.execute(
+                "INSERT INTO sales_totals (product, units, revenue, orders) "
+                "SELECT product, SUM(units), SUM(revenue), SUM(orders) FROM sales_daily GROUP BY product"
+            )
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('aggregates_built', ?)", (AGGREGATES_VERSION,))
+            conn.commit()
+
+    def add(self, order_id, order_time, order_by, product, amount, price, content):
+        conn = self._connect()
+        with self.lock:
+            try:
+                conn.execute(
+                    f"INSERT INTO orders ({_COLUMNS}, content) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (order_id, order_time, str(order_by), product, amount, price, content)
+                )
+                self._aggregate(conn, product, order_time, amount, price)
+                self._prune_hourly(conn)
+            except Exception:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def add_cart(self, order_id, order_time, order_by, lines, content):
+        """Store a multi-product order; ``lines`` are ``(product, amount, price)``."""
+        conn = self._connect()
+        with self.lock:
+            try:
+                conn.execute(
+                    f"INSERT INTO orders ({_COLUMNS}, content) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (order_id, order_time, str(order_by), cart_summary((product, amount) for product, amount, _ in lines),
+                     sum(amount for _, amount, _ in lines), sum(price for _, _, price in lines), content)
+                )
+                conn.executemany(
+                    "INSERT INTO order_items (order_id, product, amount, price) VALUES (?, ?, ?, ?)",
+                    [(order_id, product, amount, price) for product, amount, price in lines]
+                )
+                for product, amount, price in lines:
+                    self._aggregate(conn, product, order_time, amount, price)
+                self._prune_hourly(conn)
+            except Exception:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def get(self, order_id):
+        conn = self._connect()
+        with self.lock:
+            row = conn.execute(f"SELECT {_COLUMNS}, content FROM orders WHERE order_id = ?", (order_id,)).fetchone()
+        return dict(row) if row else None
+
+    def record_delivery(self, order_id, outcome, attempts, latency):
+        """Log one delivery attempt of an order (``/order`` can deliver it again later)."""
+        conn = self._connect()
+        with self.lock:
+            conn.execute(
+                "INSERT INTO deliveries (order_id, delivered_at, outcome, attempts, latency) VALUES (?, ?, ?, ?, ?)",
+                (order_id, int(time.time()), outcome, attempts, latency)
+            )
+            conn.commit()
+
+    def deliveries(self, order_id):
+        conn = self._connect()
+        with self.lock:
+            return [dict(row) for row in conn.execute(
+                "SELECT delivered_at, outcome, attempts, latency FROM deliveries WHERE order_id = ? ORDER BY delivered_at",
+                (order_id,)
+            )]
+
+    def export_rows(self, utc_offset=0, batch_size=1000):
+        """Yield every order newest first, with the time already formatted.
+
+        Uses its own read-only connection so a long export running in a
+        worker thread never holds up new orders being written.
+        """
+        self._connect()
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+        try:
+            cursor = conn.execute(
+                "SELECT order_id, strftime('%Y/%m/%d - %H:%M:%S', order_time + ?, 'unixepoch'), "
+                "order_by, product, amount, price FROM orders ORDER BY order_time DESC",
+                (utc_offset,)
+            )
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            conn.close()
+
+    def sales_by_product(self, window=None):
+        """Return ``{product: (units, revenue, orders)}``.
+
+        With ``window`` (seconds) the hourly buckets that start inside the
+        last ``window`` seconds are summed, so the result covers the current
+        hour plus the whole hours before it, never more than ``window``.
+        Windows longer than ``HOURLY_RETENTION`` use the daily buckets and
+        are rounded out to whole UTC days.
+        """
+        conn = self._connect()
+        now = int(time.time())
+        with self.lock:
+            if window is None:
+                rows = conn.execute(
+                    "SELECT product, units, revenue, orders FROM sales_totals ORDER BY product"
+                ).fetchall()
+            elif window <= HOURLY_RETENTION:
+                rows = conn.execute(
+                    "SELECT product, SUM(units), SUM(revenue), SUM(orders) FROM sales_hourly "
+                    "WHERE hour > ? GROUP BY product ORDER BY product",
+                    ((now - window) // HOUR,)
+                ).fetchall()
+            else:
+                rows = conn.execute(
+                    "SELECT product, SUM(units), SUM(revenue), SUM(orders) FROM sales_daily "
+                    "WHERE day >= ? GROUP BY product ORDER BY product",
+                    ((now - window) // DAY,)
+                ).fetchall()
+        return {product: (units, revenue, orders) for product, units, revenue, orders in rows}
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+order_store = OrderStore()
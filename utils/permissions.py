@@ -0,0 +1,65 @@
+import threading
+from utils.config import get_config_file
+
+# Memoized answers are dropped once this many (user, roles) pairs are cached
+CACHE_LIMIT = 4096
+
+def _to_ids(values):
+    ids = set()
+    for value in values:
+        try:
+            ids.add(int(str(value).strip()))
+        except ValueError:
+            print(f"Ignoring invalid id in permissions.json: {value}")
+    return frozenset(ids)
+
+class PermissionIndex:
+    """Integer id sets built from permissions.json, rebuilt only when it changes."""
+
+    def __init__(self):
+        self.version = None
+        self.users = frozenset()
+        self.roles = frozenset()
+        self.mentions = []
+        self.cache = {}
+        self.lock = threading.Lock()
+
+    def _refresh(self):
+        config_file = get_config_file('permissions')
+        permissions = config_file.get()
+        if config_file.version == self.version:
+            return
+        with self.lock:
+            if config_file.version == self.version:
+                return
+            self.users = _to_ids(permissions.get('users', []))
+            self.roles = _to_ids(permissions.get('roles', []))
+            self.mentions = [f"<@{user_id}>" for user_id in permissions.get('users', [])]
+            self.mentions += [f"<@&{role_id}>" for role_id in permissions.get('roles', [])]
+            self.cache = {}
+            self.version = config_file.version
+
+    def check(self, user_id, role_ids):
+        self._refresh()
+        user_id = int(user_id)
+        role_ids = frozenset(int(role_id) for role_id in role_ids)
+        key = (user_id, role_ids)
+        result = self.cache.get(key)
+        if result is None:
+            result = user_id in self.users or not self.roles.isdisjoint(role_ids)
+            if len(self.cache) >= CACHE_LIMIT:
+                self.cache = {}
+            self.cache[key] = result
+        return result
+
+    def mention_list(self):
+        self._refresh()
+        return list(self.mentions)
+
+permission_index = PermissionIndex()
+
+def has_special_permission(user_id, role_ids):
+    return permission_index.check(user_id, role_ids)
+
+def permission_mentions():
+    return permission_index.mention_list()
@@ -0,0 +1,98 @@
+import collections
+import heapq
+import itertools
+import threading
+import time
+from utils.stock import stock_index
+from utils.stockpool import stock_pools
+
+# Seconds a hold lasts, longer than the 60 second purchase confirmation
+HOLD_TTL = 90
+
+class Reservations:
+    """Short-lived holds on stock units between picking a product and confirming.
+
+    Holds are kept in memory only.  Each one sits in a dict by id and in a
+    min-heap by expiry; expired holds are dropped from the top of the heap
+    whenever reservations are read or changed, so no timer task is needed.
+    ``available()`` is the stock count minus every active hold on the
+    product, and ``commit()`` turns a hold into a real draw.  A hold being
+    committed keeps counting until the draw has taken the units out of
+    stock, so they are never offered to anyone else in between.
+    """
+
+    def __init__(self, ttl=HOLD_TTL):
+        self.ttl = ttl
+        self.holds = {}
+        self.held = collections.Counter()
+        self.heap = []
+        self.committing = set()
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.expired = 0
+
+    def _drop(self, hold_id):
+        product, _, amount, _ = self.holds.pop(hold_id)
+        self.held[product] -= amount
+        if self.held[product] <= 0:
+            del self.held[product]
+
+    def _expire(self, now):
+        while self.heap and self.heap[0][0] <= now:
+            _, hold_id = heapq.heappop(self.heap)
+            if hold_id in self.holds and hold_id not in self.committing:
+                self._drop(hold_id)
+                self.expired += 1
+
+    def available(self, product):
+        with self.lock:
+            self._expire(time.time())
+            return stock_index.count(product) - self.held.get(product, 0)
+
+    def hold(self, product, user_id, amount, ttl=None):
+        """Hold ``amount`` units of ``product``; returns a hold id, or None if not enough are free."""
+        now = time.time()
+        with self.lock:
+            self._expire(now)
+            if stock_index.count(product) - self.held.get(product, 0) < amount:
+                return None
+            hold_id = next(self.ids)
+            expires_at = now + (ttl or self.ttl)
+            self.holds[hold_id] = (product, str(user_id), amount, expires_at)
+            self.held[product] += amount
+            heapq.heappush(self.heap, (expires_at, hold_id))
+            return hold_id
+
+    def release(self, hold_id):
+        """Give the units back; does nothing if the hold was committed or expired."""
+        with self.lock:
+            if hold_id in self.holds and hold_id not in self.committing:
+                self._drop(hold_id)
+                return True
+            return False
+
+    def commit(self, hold_id, mode='random'):
+        """Draw the held units from stock, raising ValueError if the hold is gone or stock ran out.
+
+        Loads and writes the stock files, so call it from a worker thread.
+        """
+        with self.lock:
+            self._expire(time.time())
+            hold = self.holds.get(hold_id)
+            if hold is None or hold_id in self.committing:
+                raise ValueError("Reservation expired")
+            self.committing.add(hold_id)
+        product, _, amount, _ = hold
+        try:
+            return stock_pools.get(product).draw(amount, mode)
+        finally:
+            with self.lock:
+                self.committing.discard(hold_id)
+                self._drop(hold_id)
+
+    def stats(self):
+        with self.lock:
+            self._expire(time.time())
+            return {"holds": len(self.holds), "units": sum(self.held.values()), "expired": self.expired}
+
+reservations = Reservations()
\ No newline at end of file
@@ -0,0 +1,98 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+class Scheduler:
+    """Runs coroutine callbacks at wall-clock deadlines.
+
+    Deadlines live in a min-heap and the runner sleeps until the earliest one
+    is due, or until ``schedule()``/``cancel()`` wakes it because the earliest
+    deadline changed.  Each key has at most one pending deadline; scheduling a
+    key again replaces it.  Replaced and cancelled entries stay in the heap and
+    are skipped when they reach the top.
+    """
+
+    def __init__(self, name="scheduler"):
+        self.name = name
+        self.heap = []
+        self.entries = {}
+        self.counter = itertools.count()
+        self.wake = asyncio.Event()
+        self.task = None
+        self.running = set()
+        self.fired = 0
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def schedule(self, key, when, callback, *args):
+        """Run ``await callback(*args)`` at ``when`` (a time.time() value)."""
+        seq = next(self.counter)
+        self.entries[key] = (when, seq, callback, args)
+        heapq.heappush(self.heap, (when, seq, key))
+        if len(self.heap) > 2 * len(self.entries) + 64:
+            self.heap = [(entry[0], entry[1], k) for k, entry in self.entries.items()]
+            heapq.heapify(self.heap)
+        if self.heap[0][1] == seq:
+            self.wake.set()
+
+    def cancel(self, key):
+        if self.entries.pop(key, None) is not None:
+            self.wake.set()
+
+    def scheduled(self, key):
+        return key in self.entries
+
+    def deadline(self, key):
+        entry = self.entries.get(key)
+        return entry[0] if entry else None
+
+    def _discard_stale(self):
+        while self.heap:
+            when, seq, key = self.heap[0]
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] == seq:
+                return
+            heapq.heappop(self.heap)
+
+    async def _fire(self, key, callback, args):
+        try:
+            await callback(*args)
+        except Exception as e:
+            print(f"{self.name}: callback for {key} failed: {e}")
+
+    async def _run(self):
+        while True:
+            self.wake.clear()
+            self._discard_stale()
+            now = time.time()
+            while self.heap and self.heap[0][0] <= now:
+                _, _, key = heapq.heappop(self.heap)
+                _, _, callback, args = self.entries.pop(key)
+                self.fired += 1
+                task = asyncio.create_task(self._fire(key, callback, args))
+                self.running.add(task)
+                task.add_done_callback(self.running.discard)
+                self._discard_stale()
+
+            timeout = self.heap[0][0] - now if self.heap else None
+            try:
+                await asyncio.wait_for(self.wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self):
+        self._discard_stale()
+        return {
+            "pending": len(self.entries),
+            "heap": len(self.heap),
+            "fired": self.fired,
+            "next": self.heap[0][0] if self.heap else None,
+        }
\ No newline at end of file
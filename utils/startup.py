@@ -0,0 +1,20 @@
+import time
+
+# When this module was first imported, bot.py imports it before anything else
+STARTED = time.perf_counter()
+
+_last = STARTED
+phases = []
+
+def mark(phase):
+    """Record how long the startup phase that just finished took."""
+    global _last
+    now = time.perf_counter()
+    phases.append((phase, now - _last))
+    _last = now
+
+def total():
+    return _last - STARTED
+
+def summary():
+    return ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in phases) + f" (total {total():.2f}s)"
\ No newline at end of file
@@ -0,0 +1,126 @@
+import mmap
+import os
+import re
+import threading
+
+STOCK_DIR = 'stock'
+
+# Offsets of drawn items not yet compacted out of the stock file, see utils/stockpool.py
+TOMBSTONE_SUFFIX = '.del'
+
+# Lines that strip() to nothing, these are not counted as stock
+_BLANK_LINE = re.compile(rb'^[ \t\r\f\v]*\n', re.MULTILINE)
+
+_CHUNK_SIZE = 1 << 20
+
+def count_stock_lines(path):
+    """Count the non-blank lines of a stock file without decoding it."""
+    size = os.path.getsize(path)
+    if size == 0:
+        return 0
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        view = memoryview(m)
+        try:
+            newlines = 0
+            for start in range(0, size, _CHUNK_SIZE):
+                newlines += view[start:start + _CHUNK_SIZE].tobytes().count(b'\n')
+        finally:
+            view.release()
+        blank = sum(1 for _ in _BLANK_LINE.finditer(m))
+        lines = newlines
+        if m[size - 1:size] != b'\n':
+            last_start = m.rfind(b'\n') + 1
+            lines += 1
+            if not m[last_start:size].strip():
+                blank += 1
+    return lines - blank
+
+class StockIndex:
+    """Per-product stock counts and file sizes for the stock/ directory.
+
+    Built once from disk and then kept up to date by the commands that
+    change stock, so reading a count never opens a stock file.
+    """
+
+    def __init__(self, directory=STOCK_DIR):
+        self.directory = directory
+        self.counts = None
+        self.sizes = {}
+        self.lock = threading.Lock()
+
+    def path(self, product):
+        return os.path.join(self.directory, f"{product}.txt")
+
+    def _scan(self, product):
+        path = self.path(product)
+        count = count_stock_lines(path)
+        tomb_path = os.path.join(self.directory, f"{product}{TOMBSTONE_SUFFIX}")
+        if os.path.exists(tomb_path):
+            count -= os.path.getsize(tomb_path) // 8
+        return max(count, 0), os.path.getsize(path)
+
+    def rebuild(self):
+        counts = {}
+        sizes = {}
+        if os.path.exists(self.directory):
+            for filename in os.listdir(self.directory):
+                if not filename.endswith('.txt'):
+                    continue
+                product = filename[:-4]
+                try:
+                    counts[product], sizes[product] = self._scan(product)
+                except OSError as e:
+                    print(f"Error indexing stock file {filename}: {e}")
+        with self.lock:
+            self.counts = counts
+            self.sizes = sizes
+
+    def _ensure_loaded(self):
+        if self.counts is None:
+            self.rebuild()
+
+    def products(self):
+        self._ensure_loaded()
+        return sorted(self.counts)
+
+    def exists(self, product):
+        self._ensure_loaded()
+        return product in self.counts
+
+    def count(self, product):
+        self._ensure_loaded()
+        return self.counts.get(product, 0)
+
+    def size(self, product):
+        self._ensure_loaded()
+        return self.sizes.get(product, 0)
+
+    def set(self, product, count, size):
+        self._ensure_loaded()
+        with self.lock:
+            self.counts[product] = count
+            self.sizes[product] = size
+
+    def add(self, product, count, size):
+        self._ensure_loaded()
+        with self.lock:
+            self.counts[product] = self.counts.get(product, 0) + count
+            self.sizes[product] = self.sizes.get(product, 0) + size
+
+    def refresh(self, product):
+        """Recount one product from disk after its file was replaced."""
+        self._ensure_loaded()
+        try:
+            count, size = self._scan(product)
+        except OSError:
+            self.remove(product)
+            return
+        self.set(product, count, size)
+
+    def remove(self, product):
+        self._ensure_loaded()
+        with self.lock:
+            self.counts.pop(product, None)
+            self.sizes.pop(product, None)
+
+stock_index = StockIndex()
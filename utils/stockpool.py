@@ -0,0 +1,401 @@
+import array
+import asyncio
+import bisect
+import mmap
+import os
+import random
+import re
+import shutil
+import threading
+from utils.stock import STOCK_DIR, TOMBSTONE_SUFFIX, stock_index
+
+# A stock item is any line that does not strip() to nothing
+_ITEM_LINE = re.compile(rb'^[^\n]*?\S[^\n]*$', re.MULTILINE)
+
+# Compact once at least this many items are dead and they outnumber live ones
+COMPACT_MIN_DEAD = 1024
+
+# Bytes copied per write by append_file()
+COPY_CHUNK = 1 << 20
+
+class StockPool:
+    """The items of one product, indexed by their byte offset in stock/<product>.txt.
+
+    The text file stays the data file: restocks append to it and nothing is
+    rewritten when items are drawn.  Drawn items are marked in a tombstone
+    bitmap and their offsets appended to stock/<product>.del, so a draw of k
+    items costs O(k) and writes 8 bytes per item.  Dead lines are removed
+    from the text file by ``compact()``.
+    """
+
+    def __init__(self, product, directory=STOCK_DIR):
+        self.product = product
+        self.path = os.path.join(directory, f"{product}.txt")
+        self.tomb_path = os.path.join(directory, f"{product}{TOMBSTONE_SUFFIX}")
+        self.lock = threading.RLock()
+        self.signature = None
+        self.needs_compaction = False
+        self.compacting = False
+        # Set by /system reload, the file is re-read on next use
+        self.stale = False
+        # Bumped on every full reload, a compaction started before one is thrown away
+        self.generation = 0
+        # Items drawn while a compaction is rewriting the file, None otherwise
+        self.drawn_since = None
+        self._load()
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _load(self, keep_tombstones=True):
+        self.generation += 1
+        self.stale = False
+        self.starts = array.array('Q')
+        self.lengths = array.array('I')
+        self.file_size = 0
+        self.ends_with_newline = True
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as f:
+                self.file_size = os.fstat(f.fileno()).st_size
+                if self.file_size:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                        for match in _ITEM_LINE.finditer(m):
+                            self.starts.append(match.start())
+                            self.lengths.append(match.end() - match.start())
+                        self.ends_with_newline = m[self.file_size - 1:self.file_size] == b'\n'
+
+        total = len(self.starts)
+        self.dead = bytearray((total + 7) // 8)
+        self.dead_count = 0
+        if keep_tombstones and os.path.exists(self.tomb_path):
+            tombstones = array.array('Q')
+            with open(self.tomb_path, 'rb') as f:
+                data = f.read()
+            tombstones.frombytes(data[:len(data) - len(data) % 8])
+            for offset in tombstones:
+                item = bisect.bisect_left(self.starts, offset)
+                if item < total and self.starts[item] == offset and not self._is_dead(item):
+                    self._mark_dead(item)
+        elif os.path.exists(self.tomb_path):
+            os.remove(self.tomb_path)
+
+        # live holds the ids of live items, slot maps an id to its index in live
+        self.live = array.array('I', (item for item in range(total) if not self._is_dead(item)))
+        self.slot = array.array('l', [-1]) * total
+        for index, item in enumerate(self.live):
+            self.slot[item] = index
+        self.head = 0
+        self.signature = self._stat()
+        self._publish()
+
+    def _is_dead(self, item):
+        return self.dead[item >> 3] & (1 << (item & 7))
+
+    def _mark_dead(self, item):
+        self.dead[item >> 3] |= 1 << (item & 7)
+        self.dead_count += 1
+
+    def _remove_live(self, index):
+        item = self.live[index]
+        last = self.live.pop()
+        if last != item:
+            self.live[index] = last
+            self.slot[last] = index
+        self.slot[item] = -1
+        self._mark_dead(item)
+        if self.drawn_since is not None:
+            self.drawn_since.append(item)
+        return item
+
+    def _publish(self):
+        stock_index.set(self.product, len(self.live), self.file_size)
+
+    def _check(self):
+        """Reload if the file was changed by something other than this pool, or it is stale."""
+        signature = self._stat()
+        if signature == self.signature:
+            if self.stale:
+                self._load()
+            return
+        # A file that only grew was appended to, so existing offsets still hold
+        grew = signature is not None and self.signature is not None and signature[1] >= self.signature[1]
+        print(f"Stock file {self.path} changed on disk, reloading")
+        self._load(keep_tombstones=grew)
+
+    def _read_items(self, items):
+        if not items:
+            return []
+        with open(self.path, 'rb') as f:
+            result = []
+            for item in items:
+                f.seek(self.starts[item])
+                result.append(f.read(self.lengths[item]).strip().decode('utf-8', errors='replace'))
+        return result
+
+    def count(self):
+        with self.lock:
+            self._check()
+            return len(self.live)
+
+    def draw(self, amount, mode='random'):
+        """Remove ``amount`` items and return their text.
+
+        ``mode`` is ``'random'`` or ``'fifo'``.  Raises ``ValueError`` if there
+        is not enough stock.
+        """
+        with self.lock:
+            self._check()
+            if amount > len(self.live):
+                raise ValueError(f"Only {len(self.live)} units of '{self.product}' left in stock")
+            items = []
+            if mode == 'fifo':
+                total = len(self.starts)
+                while len(items) < amount:
+                    while self.head < total and self._is_dead(self.head):
+                        self.head += 1
+                    items.append(self._remove_live(self.slot[self.head]))
+            else:
+                for _ in range(amount):
+                    items.append(self._remove_live(random.randrange(len(self.live))))
+            lines = self._read_items(items)
+            self._append_tombstones(items)
+            if len(self.live) == 0:
+                self.clear()
+            elif self.dead_count >= COMPACT_MIN_DEAD and self.dead_count > len(self.live):
+                self.needs_compaction = True
+            self._publish()
+            return lines
+
+    def _append_tombstones(self, items):
+        tombstones = array.array('Q', (self.starts[item] for item in items))
+        with open(self.tomb_path, 'ab') as f:
+            f.write(tombstones.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+    def append(self, lines):
+        """Append already stripped, non-empty lines and return the bytes written."""
+        with self.lock:
+            self._check()
+            if not lines:
+                return 0
+            prefix = b'' if self.ends_with_newline else b'\n'
+            encoded = [line.encode('utf-8') for line in lines]
+            with open(self.path, 'ab') as f:
+                f.write(prefix + b'\n'.join(encoded) + b'\n')
+            return self._index_appended(len(prefix), [len(data) for data in encoded])
+
+    def append_file(self, src, lengths):
+        """Append a file of already stripped lines, each followed by ``\\n``.
+
+        ``lengths`` are the byte lengths of those lines.  The file is copied
+        in ``COPY_CHUNK`` pieces, so it is never held in memory, and the new
+        items are only indexed once the whole copy has been written.  If the
+        copy fails the stock file is truncated back to where it was.  Returns
+        the bytes written.
+        """
+        with self.lock:
+            self._check()
+            if not lengths:
+                return 0
+            prefix = b'' if self.ends_with_newline else b'\n'
+            src.seek(0)
+            try:
+                with open(self.path, 'ab') as f:
+                    f.write(prefix)
+                    shutil.copyfileobj(src, f, COPY_CHUNK)
+            except BaseException:
+                os.truncate(self.path, self.file_size)
+                self.signature = self._stat()
+                raise
+            return self._index_appended(len(prefix), lengths)
+
+    def _index_appended(self, prefix_size, lengths):
+        offset = self.file_size + prefix_size
+        first = len(self.starts)
+        for length in lengths:
+            self.starts.append(offset)
+            offset += length + 1
+        self.lengths.extend(lengths)
+        written = offset - self.file_size
+        self.file_size = offset
+        self.ends_with_newline = True
+        self.dead.extend(bytes((len(self.starts) + 7) // 8 - len(self.dead)))
+        self.slot.extend(range(len(self.live), len(self.live) + len(lengths)))
+        self.live.extend(range(first, len(self.starts)))
+        self.signature = self._stat()
+        self._publish()
+        return written
+
+    def replace(self, content):
+        """Replace the whole stock with ``content`` bytes."""
+        with self.lock:
+            with open(self.path, 'wb') as f:
+                f.write(content)
+            self._load(keep_tombstones=False)
+
+    def clear(self):
+        self.replace(b'')
+
+    def export(self):
+        """Return the live items as text, one per line, in file order."""
+        with self.lock:
+            self._check()
+            if self.dead_count == 0 and os.path.exists(self.path):
+                with open(self.path, 'rb') as f:
+                    return f.read()
+            items = sorted(self.live)
+            return '\n'.join(self._read_items(items)).encode('utf-8') + (b'\n' if items else b'')
+
+    def compact_in_background(self):
+        """Start ``compact()`` in a worker thread if enough items are dead."""
+        if not self.needs_compaction or self.compacting:
+            return
+        self.compacting = True
+
+        async def run():
+            try:
+                await asyncio.to_thread(self.compact)
+            except Exception as e:
+                print(f"Error compacting stock file {self.path}: {e}")
+            finally:
+                self.compacting = False
+
+        asyncio.get_running_loop().create_task(run())
+
+    def compact(self):
+        """Rewrite the text file without dead lines and drop the tombstones.
+
+        The live items are copied to a new file without holding the lock, so
+        draws and restocks of this product carry on meanwhile.  The lock is
+        only taken to snapshot the index and, at the end, to copy over lines
+        restocked in the meantime, swap the file in and re-mark items drawn
+        during the rewrite.
+        """
+        with self.lock:
+            self._check()
+            self.needs_compaction = False
+            if self.dead_count == 0:
+                return
+            generation = self.generation
+            items = sorted(self.live)
+            base_count = len(self.starts)
+            base_size = self.file_size
+            starts = self.starts[:]
+            lengths = self.lengths[:]
+            self.drawn_since = []
+
+        tmp_path = f"{self.path}.tmp"
+        try:
+            new_starts, new_lengths, remap, size = self._write_compacted(tmp_path, items, starts, lengths)
+            with self.lock:
+                self._check()
+                if self.generation != generation:
+                    # Cleared, replaced or changed on disk while rewriting
+                    os.remove(tmp_path)
+                    return
+                self._swap_compacted(tmp_path, base_count, base_size, new_starts, new_lengths, remap, size)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        finally:
+            with self.lock:
+                self.drawn_since = None
+
+    def _write_compacted(self, tmp_path, items, starts, lengths):
+        new_starts = array.array('Q')
+        new_lengths = array.array('I')
+        remap = array.array('l', [-1]) * len(starts)
+        offset = 0
+        with open(self.path, 'rb') as src, open(tmp_path, 'wb') as f:
+            with mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                for new_item, item in enumerate(items):
+                    start = starts[item]
+                    data = m[start:start + lengths[item]].strip()
+                    f.write(data + b'\n')
+                    new_starts.append(offset)
+                    new_lengths.append(len(data))
+                    remap[item] = new_item
+                    offset += len(data) + 1
+            f.flush()
+            os.fsync(f.fileno())
+        return new_starts, new_lengths, remap, offset
+
+    def _swap_compacted(self, tmp_path, base_count, base_size, starts, lengths, remap, size):
+        # Lines restocked during the rewrite are copied over unchanged
+        with open(self.path, 'rb') as f:
+            f.seek(base_size)
+            tail = f.read(self.file_size - base_size)
+        shift = size - base_size
+        for item in range(base_count, len(self.starts)):
+            remap.append(len(starts))
+            starts.append(self.starts[item] + shift)
+            lengths.append(self.lengths[item])
+        with open(tmp_path, 'ab') as f:
+            f.write(tail)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        if os.path.exists(self.tomb_path):
+            os.remove(self.tomb_path)
+
+        drawn = [remap[item] for item in self.drawn_since]
+        self.drawn_since = None
+        total = len(starts)
+        self.starts = starts
+        self.lengths = lengths
+        self.file_size = size + len(tail)
+        self.ends_with_newline = self.ends_with_newline if tail else True
+        self.dead = bytearray((total + 7) // 8)
+        self.dead_count = 0
+        self.live = array.array('I', range(total))
+        self.slot = array.array('l', range(total))
+        self.head = 0
+        for item in drawn:
+            self._remove_live(self.slot[item])
+        if drawn:
+            self._append_tombstones(drawn)
+        self.signature = self._stat()
+        self._publish()
+
+class StockPools:
+    def __init__(self, directory=STOCK_DIR):
+        self.directory = directory
+        self.pools = {}
+        self.lock = threading.Lock()
+
+    def get(self, product):
+        with self.lock:
+            pool = self.pools.get(product)
+            if pool is None:
+                pool = self.pools[product] = StockPool(product, self.directory)
+            return pool
+
+    def remove(self, product):
+        """Delete a product's stock and tombstone files."""
+        with self.lock:
+            self.pools.pop(product, None)
+        for suffix in ('.txt', TOMBSTONE_SUFFIX):
+            path = os.path.join(self.directory, f"{product}{suffix}")
+            if os.path.exists(path):
+                os.remove(path)
+        stock_index.remove(product)
+
+    def invalidate(self):
+        """Make every loaded pool re-read its file on next use.
+
+        The pool objects are kept, so draws already holding one keep sharing
+        its lock with everyone else.
+        """
+        with self.lock:
+            pools = list(self.pools.values())
+        for pool in pools:
+            with pool.lock:
+                pool.stale = True
+
+stock_pools = StockPools()